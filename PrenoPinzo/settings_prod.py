@@ -41,7 +41,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "bookings.middleware.AsyncWhiteNoiseMiddleware",  # WhiteNoise, async-capable
+    'bookings.middleware.RequestTimingMiddleware',  # Server-Timing + budgets (static files excluded)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -71,18 +72,52 @@ TEMPLATES = [
 WSGI_APPLICATION = 'PrenoPinzo.wsgi.application'
 ASGI_APPLICATION = 'PrenoPinzo.asgi.application'
 
-# Channel layers for WebSocket
+# Channel layers for WebSocket: a SQLite file next to the database, shared by
+# all the server processes (no broker needed)
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        'BACKEND': 'bookings.channel_layers.SQLiteChannelLayer',
+        'CONFIG': {
+            'path': os.environ.get(
+                'CHANNEL_LAYER_PATH',
+                Path(os.environ.get('DATABASE_PATH', BASE_DIR / 'data' / 'db.sqlite3')).parent / 'channels.sqlite3',
+            ),
+        },
     }
 }
 
 # Database - SQLite with persistent path
+# Production profile: Daphne, the notification worker, cron commands and the
+# backup script share the file, so WAL (readers never block the writer),
+# a busy timeout instead of immediate "database is locked", write
+# transactions taking the lock upfront and a bigger page cache plus mmap.
+# The PRAGMAs run on every new connection. Under Daphne (ASGI) each request
+# runs in its own thread-sensitive context, so a connection is never reused
+# by a later request: persistent connections are off for the web process.
+# The notification worker sets DB_CONN_MAX_AGE (entrypoint.sh) to keep its
+# connection across polls; one-shot management commands hold a single
+# connection for their whole run either way.
+# Verify with: python manage.py check_sqlite_profile
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'cache_size': -20000,  # KiB (20 MB) per connection
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 128 * 1024 * 1024)),
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': Path(os.environ.get('DATABASE_PATH', BASE_DIR / 'data' / 'db.sqlite3')),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+        },
     }
 }
 
@@ -154,6 +189,9 @@ HA_TOKEN = os.environ.get('HA_TOKEN', '')
 HA_CLIMATE_ENTITY = os.environ.get('HA_CLIMATE_ENTITY', 'climate.salotto')
 HA_SELECT_ENTITY = os.environ.get('HA_SELECT_ENTITY', 'select.pinzolo')
 
+# /metrics/ (Prometheus): when set, scrapers must send "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 
 # ============================================================
 # Security Settings for Production
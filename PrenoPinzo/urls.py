@@ -17,14 +17,23 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseForbidden
 from django.conf import settings
 from django.conf.urls.static import static
+from django.utils.crypto import constant_time_compare
+from bookings import metrics
 
 def health_check(request):
     """Health check endpoint for Docker/load balancer."""
     return JsonResponse({'status': 'healthy'})
 
+def metrics_view(request):
+    """Prometheus text format metrics (Bearer METRICS_TOKEN required when set)."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('bookings.urls')),
@@ -60,6 +69,7 @@ urlpatterns = [
     
     path('health/', health_check, name='health_check'),
     path('health/', health_check, name='health_check'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
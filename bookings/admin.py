@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from .models import UserProfile, Booking
+from .models import UserProfile, Booking, NotificationOutbox
 
 class UserProfileInline(admin.StackedInline):
     model = UserProfile
@@ -20,3 +20,9 @@ class BookingAdmin(admin.ModelAdmin):
     list_display = ('title', 'family_group', 'start_date', 'end_date', 'status', 'pending_with')
     list_filter = ('family_group', 'status')
     search_fields = ('title', 'user__username')
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ('booking', 'action_type', 'recipient_family', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'action_type')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
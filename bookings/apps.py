@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class BookingsConfig(AppConfig):
     name = 'bookings'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import request_timing
+
+        request_timing.install()
@@ -0,0 +1,129 @@
+"""
+Process-local interval index of the bookings that block new requests.
+
+APPROVED and DEROGA bookings are kept in a list sorted by start date, so
+overlap checks become a bisect over memory instead of a range query on
+every create/modify/deroga/drag & drop.
+
+Every booking write bumps the DataVersion counter in its own transaction
+(versioning.py). The post_save/post_delete handlers in signals.py apply the
+change to the index on commit, together with the counter value it produced;
+the index follows the counter one step at a time and drops itself if a
+step is missing (a write made by another process). Every lookup reads the
+counter (a primary key lookup) and reloads only if it moved on without
+this process, so writes made elsewhere are seen immediately. The write
+views run the lookup inside their atomic block, which under settings_prod
+is BEGIN IMMEDIATE: no other writer can slip in between check and save.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import timedelta
+
+ACTIVE_STATUSES = ('APPROVED', 'DEROGA')
+
+# start_date and id come first so (start_date, id) tuples can be bisected
+BookingInterval = namedtuple(
+    'BookingInterval',
+    ['start_date', 'id', 'end_date', 'title', 'family_group', 'status'],
+)
+
+
+def interval_from_booking(booking):
+    return BookingInterval(
+        start_date=booking.start_date,
+        id=booking.id,
+        end_date=booking.end_date,
+        title=booking.title,
+        family_group=booking.family_group,
+        status=booking.status,
+    )
+
+
+class BookingIntervalIndex:
+    """Sorted, thread-safe interval list of APPROVED/DEROGA bookings."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._intervals = None  # sorted by (start_date, id); None = not loaded
+        self._starts = []
+        self._by_id = {}
+        self._max_span = timedelta(0)
+        self._version = None
+
+    def load(self):
+        """(Re)build the index from the database."""
+        from .models import Booking
+        from .versioning import booking_version
+
+        # Version first: a write landing in between only causes an extra reload
+        version = booking_version()
+        bookings = Booking.objects.filter(status__in=ACTIVE_STATUSES).only(
+            'id', 'start_date', 'end_date', 'title', 'family_group', 'status'
+        )
+        intervals = sorted(interval_from_booking(b) for b in bookings)
+        with self._lock:
+            self._intervals = intervals
+            self._starts = [i.start_date for i in intervals]
+            self._by_id = {i.id: i for i in intervals}
+            self._max_span = max((i.end_date - i.start_date for i in intervals), default=timedelta(0))
+            self._version = version
+
+    def invalidate(self):
+        with self._lock:
+            self._intervals = None
+
+    def _ensure_loaded(self):
+        from .versioning import booking_version
+
+        if self._intervals is None or booking_version() != self._version:
+            self.load()
+
+    def _remove_locked(self, booking_id):
+        old = self._by_id.pop(booking_id, None)
+        if old is None:
+            return
+        pos = bisect_left(self._intervals, (old.start_date, old.id))
+        del self._intervals[pos]
+        del self._starts[pos]
+
+    def apply(self, version, booking_id, interval=None):
+        """
+        Committed write number `version`: the booking's new interval, or None
+        if it was deleted. Out of sequence (another process wrote in between),
+        the index is dropped and reloaded on the next lookup.
+        """
+        with self._lock:
+            if self._intervals is None:
+                return  # Loaded lazily on the next lookup anyway
+            if self._version is None or version != self._version + 1:
+                self._intervals = None
+                return
+            self._version = version
+            self._remove_locked(booking_id)
+            if interval is None or interval.status not in ACTIVE_STATUSES:
+                return
+            pos = bisect_left(self._intervals, (interval.start_date, interval.id))
+            self._intervals.insert(pos, interval)
+            self._starts.insert(pos, interval.start_date)
+            self._by_id[interval.id] = interval
+            self._max_span = max(self._max_span, interval.end_date - interval.start_date)
+
+    def overlapping(self, start_date, end_date, exclude_id=None):
+        """
+        Return the active bookings overlapping [start_date, end_date].
+        Same rule as Booking.check_overlap: StartA < EndB and EndA > StartB.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            # Candidates start before end_date; anything starting earlier than
+            # start_date - max_span ends too early to overlap.
+            hi = bisect_left(self._starts, end_date)
+            lo = bisect_right(self._starts, start_date - self._max_span, 0, hi)
+            return [
+                i for i in self._intervals[lo:hi]
+                if i.end_date > start_date and i.id != exclude_id
+            ]
+
+
+booking_index = BookingIntervalIndex()
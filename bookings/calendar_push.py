@@ -0,0 +1,67 @@
+"""
+Live calendar diffs pushed over the 'booking_events' channel group.
+
+The Booking post_save/post_delete handlers in signals.py call
+push_booking_change once the write is committed (rolled back transitions
+never reach the calendars). Each diff carries the booking id, the kind of
+change and, unless the booking left the calendar, its row in the compact
+booking_events layout, so open calendars patch that single event instead of
+re-downloading the feed.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+BOOKING_EVENTS_GROUP = 'booking_events'
+
+# Statuses shown on the calendar
+CALENDAR_STATUSES = ('NEGOTIATION', 'APPROVED', 'DEROGA')
+
+# Row layout of the compact booking_events payload (see calendar.html)
+BOOKING_EVENT_FIELDS = ['id', 'title', 'family_group', 'status', 'pending_with', 'start_date', 'end_date']
+
+
+def booking_event_row(booking):
+    return [
+        booking.id, booking.title, booking.family_group, booking.status,
+        booking.pending_with, booking.start_date.isoformat(), booking.end_date.isoformat(),
+    ]
+
+
+def booking_change(old, booking):
+    """
+    Diff for a saved booking, old being the usage_stats snapshot of the row
+    before the save (None on creation). Returns None if the calendar is unaffected.
+    """
+    if booking.status not in CALENDAR_STATUSES:
+        if old is None or old.status not in CALENDAR_STATUSES:
+            return None
+        return {'change': 'removed', 'id': booking.id, 'row': None}
+
+    if old is None or old.status not in CALENDAR_STATUSES:
+        change = 'created'
+    elif (old.start_date, old.end_date) != (booking.start_date, booking.end_date):
+        change = 'dates'
+    elif old.status != booking.status:
+        change = 'status'
+    else:
+        change = 'updated'  # Title or pending_with
+    return {'change': change, 'id': booking.id, 'row': booking_event_row(booking)}
+
+
+def push_booking_change(diff):
+    """Send a diff to the open calendars; never fails the caller"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(BOOKING_EVENTS_GROUP, {
+            'type': 'booking_change',
+            'fields': BOOKING_EVENT_FIELDS,
+            **diff,
+        })
+    except Exception:
+        logger.exception(f"Could not push the change of booking {diff['id']}")
@@ -0,0 +1,314 @@
+"""
+Channel layer backed by a local SQLite file.
+
+InMemoryChannelLayer only reaches consumers living in the same process, so
+running two Daphne workers would split the family chat (and the other live
+groups) into islands. This layer keeps messages and group memberships in a
+small SQLite database shared by every process on the host, with no external
+broker:
+
+- send/group_send insert rows in the `messages` table (JSON payloads, so
+  events must be JSON serialisable);
+- every process polls once for all of its own channels (the part of the
+  channel name before '!' identifies the process) and hands the messages
+  to the waiting receive() calls; the poll interval backs off while idle,
+  and an idle poll is a plain indexed SELECT (the write lock is only taken
+  when there are messages to claim);
+- expired messages and group memberships are purged periodically;
+- acquire_lease/release_lease give one process at a time a named role
+  (the Home Assistant poller), with an expiry covering crashed holders.
+
+Configuration (CHANNEL_LAYERS['default']['CONFIG']): path, expiry,
+group_expiry, capacity, channel_capacity, poll_interval, max_poll_interval.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import string
+import threading
+import time
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_channel_idx ON messages (channel, id);
+CREATE INDEX IF NOT EXISTS messages_expires_idx ON messages (expires);
+CREATE TABLE IF NOT EXISTS group_members (
+    group_name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (group_name, channel)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+def _random_suffix(length=12):
+    return ''.join(random.choice(string.ascii_letters) for _ in range(length))
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path='channels.sqlite3', expiry=60, group_expiry=86400, capacity=100,
+                 channel_capacity=None, poll_interval=0.05, max_poll_interval=0.5, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.path = str(path)
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+
+        # Prefix of the process-specific channels created here
+        self.client_prefix = f"specific.{os.getpid()}.{_random_suffix(8)}!"
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+        # Per event loop: receive queues of our channels and the poll task
+        self._queues = {}
+        self._poll_task = None
+        self._poll_loop = None
+        self._last_purge = 0.0
+
+    # ------------------------------------------------------------------
+    # SQLite access (runs in executor threads, one connection per thread)
+    # ------------------------------------------------------------------
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def _insert(self, rows):
+        """Insert (channel, payload) rows, skipping channels at capacity. Returns the full ones."""
+        conn = self._connection()
+        now = time.time()
+        full = []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for channel, payload in rows:
+                count = conn.execute(
+                    'SELECT COUNT(*) FROM messages WHERE channel = ? AND expires > ?', (channel, now)
+                ).fetchone()[0]
+                if count >= self.get_capacity(channel):
+                    full.append(channel)
+                    continue
+                conn.execute(
+                    'INSERT INTO messages (channel, payload, expires) VALUES (?, ?, ?)',
+                    (channel, payload, now + self.expiry),
+                )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return full
+
+    def _claim(self, channel_filter, params, limit=100):
+        """Atomically take (delete and return) the pending messages matching the filter"""
+        conn = self._connection()
+        # Plain read first: idle polls must not take the database write lock
+        if conn.execute(f'SELECT 1 FROM messages WHERE {channel_filter} LIMIT 1', params).fetchone() is None:
+            return []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                f'SELECT id, channel, payload, expires FROM messages WHERE {channel_filter} ORDER BY id LIMIT ?',
+                (*params, limit),
+            ).fetchall()
+            if rows:
+                conn.executemany('DELETE FROM messages WHERE id = ?', [(row[0],) for row in rows])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        now = time.time()
+        return [(channel, payload) for _, channel, payload, expires in rows if expires > now]
+
+    def _purge(self):
+        conn = self._connection()
+        now = time.time()
+        conn.execute('DELETE FROM messages WHERE expires <= ?', (now,))
+        conn.execute('DELETE FROM group_members WHERE expires <= ?', (now,))
+
+    # ------------------------------------------------------------------
+    # Channel layer API
+    # ------------------------------------------------------------------
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        assert '__asgi_channel__' not in message
+        full = await self._run(self._insert, [(channel, json.dumps(message))])
+        if full:
+            raise ChannelFull(channel)
+
+    async def new_channel(self, prefix='specific'):
+        channel = f"{self.client_prefix}{prefix}.{_random_suffix()}"
+        self._ensure_poller()
+        self._queues.setdefault(channel, asyncio.Queue())
+        return channel
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+        if channel.startswith(self.client_prefix):
+            self._ensure_poller()
+            queue = self._queues.setdefault(channel, asyncio.Queue())
+            try:
+                return await queue.get()
+            except asyncio.CancelledError:
+                # The consumer is gone: stop collecting messages for it
+                if queue.empty():
+                    self._queues.pop(channel, None)
+                raise
+
+        # Normal (non process-specific) channel: poll for it directly
+        interval = self.poll_interval
+        while True:
+            messages = await self._run(self._claim, 'channel = ?', (channel,), 1)
+            if messages:
+                return json.loads(messages[0][1])
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+
+    def _ensure_poller(self):
+        loop = asyncio.get_running_loop()
+        if self._poll_task is None or self._poll_task.done() or self._poll_loop is not loop:
+            if self._poll_loop is not loop:
+                self._queues = {}
+            self._poll_loop = loop
+            self._poll_task = loop.create_task(self._poll())
+
+    async def _poll(self):
+        """Move the messages of this process' channels into their receive queues"""
+        interval = self.poll_interval
+        prefix_filter = 'channel >= ? AND channel < ?'
+        # Every channel starting with the prefix (upper bound: next char after '!')
+        params = (self.client_prefix, self.client_prefix[:-1] + '"')
+        while True:
+            try:
+                messages = await self._run(self._claim, prefix_filter, params)
+                if time.monotonic() - self._last_purge > 30:
+                    self._last_purge = time.monotonic()
+                    await self._run(self._purge)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Channel layer poll failed')
+                messages = []
+
+            for channel, payload in messages:
+                queue = self._queues.get(channel)
+                if queue is not None:
+                    queue.put_nowait(json.loads(payload))
+                else:
+                    logger.debug(f'Dropped a message for {channel}: no consumer is receiving on it')
+
+            if messages:
+                interval = self.poll_interval
+            else:
+                await asyncio.sleep(interval)
+                interval = min(interval * 1.5, self.max_poll_interval)
+
+    async def flush(self):
+        def _flush():
+            conn = self._connection()
+            conn.execute('DELETE FROM messages')
+            conn.execute('DELETE FROM group_members')
+        await self._run(_flush)
+        self._queues = {}
+
+    # ------------------------------------------------------------------
+    # Groups
+    # ------------------------------------------------------------------
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+
+        def _add():
+            self._connection().execute(
+                'INSERT OR REPLACE INTO group_members (group_name, channel, expires) VALUES (?, ?, ?)',
+                (group, channel, time.time() + self.group_expiry),
+            )
+        await self._run(_add)
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+
+        def _discard():
+            self._connection().execute(
+                'DELETE FROM group_members WHERE group_name = ? AND channel = ?', (group, channel)
+            )
+        await self._run(_discard)
+
+    # ------------------------------------------------------------------
+    # Leases (not part of the channel layer spec)
+    # ------------------------------------------------------------------
+
+    async def acquire_lease(self, name, ttl):
+        """Take or renew the named lease for this process; False while another holds it"""
+        def _acquire():
+            now = time.time()
+            cursor = self._connection().execute(
+                'INSERT INTO leases (name, holder, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires = excluded.expires '
+                'WHERE leases.holder = excluded.holder OR leases.expires <= ?',
+                (name, self.client_prefix, now + ttl, now),
+            )
+            return cursor.rowcount > 0
+        return await self._run(_acquire)
+
+    async def release_lease(self, name):
+        def _release():
+            self._connection().execute(
+                'DELETE FROM leases WHERE name = ? AND holder = ?', (name, self.client_prefix)
+            )
+        await self._run(_release)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        assert self.valid_group_name(group), 'Group name not valid'
+        payload = json.dumps(message)
+
+        def _group_send():
+            channels = [
+                row[0] for row in self._connection().execute(
+                    'SELECT channel FROM group_members WHERE group_name = ? AND expires > ?',
+                    (group, time.time()),
+                )
+            ]
+            # Like the other layers, full channels silently miss group messages
+            return self._insert([(channel, payload) for channel in channels]) if channels else []
+        await self._run(_group_send)
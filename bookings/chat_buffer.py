@@ -0,0 +1,211 @@
+"""
+Write-behind buffer and presence coalescing for the family chat.
+
+ChatConsumer hands new messages to the room's ChatWriteBuffer instead of
+inserting them one by one: the buffer collects what arrives within
+CHAT_WRITE_DELAY seconds (or CHAT_WRITE_BATCH messages), stores it with a
+single bulk_create in one transaction and then broadcasts the whole batch
+with one group_send to the room plus one unread delta per sender.
+Pending messages are drained when the last chat connection of the process
+closes and, under Daphne, before the reactor shuts down.
+
+ChatPresence counts the chat connections of each user in this process, so
+a second tab or a page reload does not announce the user again: 'online'
+is sent for the first connection only, and 'offline' is delayed by
+CHAT_STATUS_DEBOUNCE seconds and dropped if the user comes back meanwhile.
+The counts are per process: with several web workers, a user connected to
+two of them is announced by each.
+"""
+import asyncio
+import logging
+import sys
+from collections import Counter
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from .models import ChatMessage, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Every open page of every authenticated user (unread chat badge)
+NOTIFICATIONS_GROUP = 'notifications'
+
+
+def epoch_ms(dt):
+    return int(dt.timestamp() * 1000)
+
+
+class ChatWriteBuffer:
+    def __init__(self, room_group_name):
+        self.room_group_name = room_group_name
+        self._pending = []  # (user, content, reply_channel)
+        self._task = None
+        self._full = None
+
+    def _delay(self):
+        return getattr(settings, 'CHAT_WRITE_DELAY', 0.05)
+
+    def _batch_size(self):
+        return getattr(settings, 'CHAT_WRITE_BATCH', 50)
+
+    def add(self, user, content, reply_channel):
+        """Queue a message; it is saved and broadcast by the next flush"""
+        self._pending.append((user, content, reply_channel))
+        if self._task is None or self._task.done():
+            self._full = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        if len(self._pending) >= self._batch_size():
+            self._full.set()
+
+    async def drain(self):
+        """Save and broadcast the pending messages now"""
+        if self._task is not None and not self._task.done():
+            self._full.set()
+            await asyncio.shield(self._task)
+
+    async def _run(self):
+        while self._pending:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self._delay())
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            batch = self._pending[:self._batch_size()]
+            del self._pending[:len(batch)]
+            try:
+                await self.flush(batch)
+            except Exception:
+                logger.exception(f"Could not save {len(batch)} chat messages")
+                await self._report_failure(batch)
+
+    @database_sync_to_async
+    def save(self, batch):
+        """Insert the batch in one transaction and return the broadcast payloads"""
+        with transaction.atomic():
+            messages = ChatMessage.objects.bulk_create([
+                ChatMessage(sender=user, content=content) for user, content, _ in batch
+            ])
+        families = dict(
+            UserProfile.objects.filter(user_id__in={user.id for user, _, _ in batch})
+            .values_list('user_id', 'family_group')
+        )
+        return [
+            {
+                'id': message.id,
+                'content': message.content,
+                'sender': user.username,
+                'sender_family': families.get(user.id, ''),
+                'ts': epoch_ms(message.timestamp),
+            }
+            for message, (user, _, _) in zip(messages, batch)
+        ]
+
+    async def flush(self, batch):
+        payloads = await self.save(batch)
+        channel_layer = get_channel_layer()
+
+        # Unread badge: +n on every page of the other users
+        for sender_id, count in Counter(user.id for user, _, _ in batch).items():
+            await channel_layer.group_send(NOTIFICATIONS_GROUP, {
+                'type': 'unread_delta',
+                'delta': count,
+                'sender_id': sender_id,
+            })
+
+        await channel_layer.group_send(self.room_group_name, {
+            'type': 'chat_messages',
+            'messages': payloads,
+        })
+
+    async def _report_failure(self, batch):
+        channel_layer = get_channel_layer()
+        for reply_channel in {reply_channel for _, _, reply_channel in batch}:
+            try:
+                await channel_layer.send(reply_channel, {'type': 'chat_send_failed'})
+            except Exception:
+                logger.exception("Could not report the failed chat messages")
+
+
+class ChatPresence:
+    def __init__(self):
+        self._connections = Counter()
+        self._offline_timers = {}  # username -> delayed 'offline' task
+
+    def _debounce(self):
+        return getattr(settings, 'CHAT_STATUS_DEBOUNCE', 5)
+
+    def joined(self, username):
+        """Register a connection; True if 'online' has to be announced"""
+        timer = self._offline_timers.pop(username, None)
+        if timer is not None:
+            timer.cancel()  # Back before the others were told it left
+        announce = timer is None and self._connections[username] == 0
+        self._connections[username] += 1
+        return announce
+
+    @property
+    def connections(self):
+        """Open chat connections in this process, all users"""
+        return sum(self._connections.values())
+
+    def left(self, username, room_group_name):
+        """Unregister a connection; 'offline' follows the last one after the debounce window"""
+        self._connections[username] -= 1
+        if self._connections[username] > 0:
+            return
+        del self._connections[username]
+        self._offline_timers[username] = asyncio.ensure_future(
+            self._announce_offline(username, room_group_name)
+        )
+
+    async def _announce_offline(self, username, room_group_name):
+        await asyncio.sleep(self._debounce())
+        self._offline_timers.pop(username, None)
+        await get_channel_layer().group_send(room_group_name, {
+            'type': 'user_status',
+            'username': username,
+            'status': 'offline',
+        })
+
+
+_buffers = {}
+_shutdown_hooked = False
+
+
+def chat_buffer(room_group_name):
+    """Write buffer of the room for the running event loop"""
+    key = (asyncio.get_running_loop(), room_group_name)
+    if key not in _buffers:
+        _buffers[key] = ChatWriteBuffer(room_group_name)
+        _drain_before_shutdown()
+    return _buffers[key]
+
+
+async def drain_chat_buffers():
+    """Drain every write buffer of the running event loop"""
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(
+        buffer.drain() for (buffer_loop, _), buffer in list(_buffers.items()) if buffer_loop is loop
+    ))
+
+
+def _drain_before_shutdown():
+    # Daphne does not speak the ASGI lifespan protocol: hook the Twisted
+    # reactor it runs on instead (only if already imported, importing it
+    # would install one)
+    global _shutdown_hooked
+    reactor = sys.modules.get('twisted.internet.reactor')
+    if _shutdown_hooked or reactor is None:
+        return
+    from twisted.internet import defer
+
+    _shutdown_hooked = True
+    reactor.addSystemEventTrigger(
+        'before', 'shutdown', lambda: defer.Deferred.fromFuture(asyncio.ensure_future(drain_chat_buffers())),
+    )
+
+
+chat_presence = ChatPresence()
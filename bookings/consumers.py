@@ -1,14 +1,40 @@
 """
-WebSocket consumer for real-time chat.
+WebSocket consumers for real-time chat, site-wide notifications, live
+calendar changes and thermostat updates.
 """
 import json
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import ChatMessage
+from django.db.models import Q
+from .models import ChatMessage, ChatReadState
+from .chat_buffer import chat_buffer, chat_presence, epoch_ms, NOTIFICATIONS_GROUP
+from .calendar_push import BOOKING_EVENTS_GROUP
+from .ha_poller import ha_poller, THERMOSTAT_GROUP
+from .metrics import WEBSOCKET_CONNECTIONS
 
+CHAT_PAGE_SIZE = 50
+CHAT_PAGE_FIELDS = ['id', 'sender_id', 'ts', 'content']
 
-class ChatConsumer(AsyncWebsocketConsumer):
+
+class CountedConsumer(AsyncWebsocketConsumer):
+    """Keeps the open connections gauge of /metrics/ (accepted sockets only)"""
+    
+    async def accept(self, *args, **kwargs):
+        await super().accept(*args, **kwargs)
+        self.counted = True
+        WEBSOCKET_CONNECTIONS.inc(consumer=type(self).__name__)
+    
+    async def websocket_disconnect(self, message):
+        if getattr(self, 'counted', False):
+            self.counted = False
+            WEBSOCKET_CONNECTIONS.dec(consumer=type(self).__name__)
+        await super().websocket_disconnect(message)
+
+
+class ChatConsumer(CountedConsumer):
     """
     WebSocket consumer for family chat.
     All authenticated users join the same 'family_chat' group.
@@ -17,6 +43,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_group_name = 'family_chat'
         self.user = self.scope['user']
+        self.joined = False
         
         if not self.user.is_authenticated:
             await self.close()
@@ -29,44 +56,48 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
         
         await self.accept()
+        self.typing_state = False
+        self.typing_sent_at = 0
         
         # Mark messages as read when user opens chat
-        await self.mark_messages_read()
+        await self.mark_read_and_notify()
         
-        # Send chat history
-        history = await self.get_chat_history()
+        # Send the latest page of chat history
+        page = await self.get_history_page()
         await self.send(text_data=json.dumps({
-            'type': 'chat_history',
-            'messages': history
+            'type': 'chat_page',
+            'initial': True,
+            **page
         }))
         
-        # Notify others that user joined
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_status',
-                'username': self.user.username,
-                'status': 'online'
-            }
-        )
-    
-    async def disconnect(self, close_code):
-        # Notify others that user left
-        if hasattr(self, 'user') and self.user.is_authenticated:
+        # Notify others that user joined (not again for a second tab or a reload)
+        announce = chat_presence.joined(self.user.username)
+        self.joined = True
+        if announce:
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     'type': 'user_status',
                     'username': self.user.username,
-                    'status': 'offline'
+                    'status': 'online'
                 }
             )
+    
+    async def disconnect(self, close_code):
+        # Notify others that user left (debounced, see ChatPresence)
+        if getattr(self, 'joined', False):
+            self.joined = False
+            chat_presence.left(self.user.username, self.room_group_name)
         
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        
+        # Last chat connection of this process: don't leave messages in memory
+        if chat_presence.connections == 0:
+            await chat_buffer(self.room_group_name).drain()
     
     async def receive(self, text_data):
         data = json.loads(text_data)
@@ -75,46 +106,66 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if message_type == 'message':
             content = data.get('content', '').strip()
             if content:
-                # Save to database
-                message_data = await self.save_message(content)
-                
-                # Broadcast to group
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'chat_message',
-                        'id': message_data['id'],
-                        'content': content,
-                        'sender': self.user.username,
-                        'sender_family': message_data['sender_family'],
-                        'timestamp': message_data['timestamp']
-                    }
-                )
+                # Saved and broadcast in batches by the room's write buffer
+                chat_buffer(self.room_group_name).add(self.user, content, self.channel_name)
+                self.typing_state = False  # Sending a message ends typing
         
         elif message_type == 'typing':
-            # Broadcast typing indicator
+            # Broadcast typing indicator changes; repeats are debounced
+            is_typing = bool(data.get('is_typing', False))
+            now = time.monotonic()
+            debounce = getattr(settings, 'CHAT_TYPING_DEBOUNCE', 2)
+            if is_typing == self.typing_state and (not is_typing or now - self.typing_sent_at < debounce):
+                return
+            self.typing_state = is_typing
+            self.typing_sent_at = now
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     'type': 'typing_indicator',
                     'username': self.user.username,
-                    'is_typing': data.get('is_typing', False)
+                    'is_typing': is_typing
                 }
             )
         
+        elif message_type == 'load_before':
+            # Older messages for infinite scroll
+            try:
+                before_id = int(data.get('before_id'))
+            except (TypeError, ValueError):
+                return
+            page = await self.get_history_page(before_id)
+            await self.send(text_data=json.dumps({
+                'type': 'chat_page',
+                'initial': False,
+                **page
+            }))
+        
         elif message_type == 'mark_read':
             # Mark messages as read
-            await self.mark_messages_read()
+            await self.mark_read_and_notify()
     
-    async def chat_message(self, event):
-        """Send message to WebSocket"""
+    async def mark_read_and_notify(self):
+        """Mark messages as read and have this user's pages recount their unread badge"""
+        if await self.mark_messages_read():
+            await self.channel_layer.group_send(
+                NOTIFICATIONS_GROUP,
+                {'type': 'unread_recount', 'user_id': self.user.id}
+            )
+    
+    async def chat_messages(self, event):
+        """Send a batch of new messages to WebSocket"""
+        for message in event['messages']:
+            await self.send(text_data=json.dumps({
+                'type': 'message',
+                **message
+            }))
+    
+    async def chat_send_failed(self, event):
+        """The write buffer could not save this connection's messages"""
         await self.send(text_data=json.dumps({
-            'type': 'message',
-            'id': event['id'],
-            'content': event['content'],
-            'sender': event['sender'],
-            'sender_family': event['sender_family'],
-            'timestamp': event['timestamp']
+            'type': 'error',
+            'message': 'Messaggio non inviato, riprova'
         }))
     
     async def typing_indicator(self, event):
@@ -136,35 +187,156 @@ class ChatConsumer(AsyncWebsocketConsumer):
         }))
     
     @database_sync_to_async
-    def save_message(self, content):
-        """Save message to database"""
-        message = ChatMessage.objects.create(
-            sender=self.user,
-            content=content
+    def get_history_page(self, before_id=None):
+        """
+        One page of messages older than before_id (newest page if None),
+        keyset-paginated on (timestamp, id) and in the compact format:
+        rows of [id, sender_id, ts (epoch ms), content] plus a senders map.
+        Times and dates are formatted by the browser.
+        """
+        messages = ChatMessage.objects.all()
+        if before_id is not None:
+            cursor = ChatMessage.objects.filter(id=before_id).values_list('timestamp', flat=True).first()
+            if cursor is None:
+                return {'fields': CHAT_PAGE_FIELDS, 'rows': [], 'senders': {}, 'has_more': False}
+            # (timestamp, id) < cursor; the plain timestamp bound lets SQLite
+            # seek in the index instead of scanning the newer messages
+            messages = messages.filter(timestamp__lte=cursor).filter(
+                Q(timestamp__lt=cursor) | Q(id__lt=before_id)
+            )
+        rows = list(
+            messages.order_by('-timestamp', '-id')
+            .values_list('id', 'sender_id', 'timestamp', 'content')[:CHAT_PAGE_SIZE + 1]
         )
+        has_more = len(rows) > CHAT_PAGE_SIZE
+        rows = rows[:CHAT_PAGE_SIZE]
+        rows.reverse()  # Oldest first, as displayed
+        
+        sender_ids = {sender_id for _, sender_id, _, _ in rows}
+        senders = {
+            user_id: [username, family_group]
+            for user_id, username, family_group in User.objects.filter(id__in=sender_ids)
+            .values_list('id', 'username', 'profile__family_group')
+        }
         return {
-            'id': message.id,
-            'sender_family': self.user.profile.family_group,
-            'timestamp': message.timestamp.strftime('%H:%M')
+            'fields': CHAT_PAGE_FIELDS,
+            'rows': [[msg_id, sender_id, epoch_ms(ts), content] for msg_id, sender_id, ts, content in rows],
+            'senders': senders,
+            'has_more': has_more,
         }
     
-    @database_sync_to_async
-    def get_chat_history(self):
-        """Get last 50 messages"""
-        messages = ChatMessage.objects.select_related('sender', 'sender__profile').order_by('-timestamp')[:50]
-        return [
-            {
-                'id': msg.id,
-                'content': msg.content,
-                'sender': msg.sender.username,
-                'sender_family': msg.sender.profile.family_group,
-                'timestamp': msg.timestamp.strftime('%H:%M'),
-                'date': msg.timestamp.strftime('%d/%m/%Y')
-            }
-            for msg in reversed(messages)
-        ]
-    
     @database_sync_to_async
     def mark_messages_read(self):
-        """Mark all messages not from this user as read"""
-        ChatMessage.objects.exclude(sender=self.user).update(is_read=True)
+        """Move this user's read pointer to the latest message, True if it moved"""
+        return ChatReadState.mark_read(self.user)
+
+
+class NotificationConsumer(CountedConsumer):
+    """
+    Site-wide socket opened by base.html: keeps the unread chat badge up to
+    date with pushed deltas instead of polling the unread count.
+    """
+    
+    async def connect(self):
+        self.user = self.scope['user']
+        
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+        
+        await self.channel_layer.group_add(NOTIFICATIONS_GROUP, self.channel_name)
+        await self.accept()
+        
+        # Absolute count once; deltas afterwards
+        await self.send_unread_count()
+    
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(NOTIFICATIONS_GROUP, self.channel_name)
+    
+    async def unread_delta(self, event):
+        """A new chat message: +1 for everybody but its sender"""
+        if event['sender_id'] != self.user.id:
+            await self.send(text_data=json.dumps({
+                'type': 'unread_delta',
+                'delta': event['delta']
+            }))
+    
+    async def unread_recount(self, event):
+        """The user read the chat (maybe on another page): send the new absolute count"""
+        if event['user_id'] == self.user.id:
+            await self.send_unread_count()
+    
+    async def send_unread_count(self):
+        count = await database_sync_to_async(ChatMessage.unread_count_for)(self.user)
+        await self.send(text_data=json.dumps({
+            'type': 'unread_count',
+            'count': count
+        }))
+
+
+class BookingEventsConsumer(CountedConsumer):
+    """
+    Opened by the calendar page: forwards the booking diffs pushed by
+    calendar_push after every committed change.
+    """
+    
+    async def connect(self):
+        self.user = self.scope['user']
+        
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+        
+        await self.channel_layer.group_add(BOOKING_EVENTS_GROUP, self.channel_name)
+        await self.accept()
+    
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(BOOKING_EVENTS_GROUP, self.channel_name)
+    
+    async def booking_change(self, event):
+        """Send a booking diff to WebSocket"""
+        await self.send(text_data=json.dumps({
+            'type': 'booking_change',
+            'change': event['change'],
+            'id': event['id'],
+            'fields': event['fields'],
+            'row': event['row']
+        }))
+
+
+class ThermostatConsumer(CountedConsumer):
+    """
+    Pushes the thermostat/schedule state read by the shared ha_poller.
+    Clients never trigger Home Assistant requests themselves.
+    """
+    
+    async def connect(self):
+        self.user = self.scope['user']
+        self.subscribed = False
+        
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+        
+        await self.channel_layer.group_add(THERMOSTAT_GROUP, self.channel_name)
+        await self.accept()
+        
+        ha_poller.subscribe()
+        self.subscribed = True
+        
+        # Current state right away; changes arrive through the group
+        if ha_poller.snapshot is not None:
+            await self.send_state(ha_poller.snapshot)
+    
+    async def disconnect(self, close_code):
+        if getattr(self, 'subscribed', False):
+            ha_poller.unsubscribe()
+        await self.channel_layer.group_discard(THERMOSTAT_GROUP, self.channel_name)
+    
+    async def thermostat_state(self, event):
+        """Send a new snapshot to WebSocket"""
+        ha_poller.remember(event['state'])
+        await self.send_state(event['state'])
+    
+    async def send_state(self, state):
+        await self.send(text_data=json.dumps({'type': 'thermostat_state', **state}))
@@ -0,0 +1,123 @@
+"""
+Day-coverage engine: occupancy of a set of date ranges over calendar buckets.
+
+Ranges are stored as two sorted day-ordinal arrays (starts and exclusive
+ends) with prefix sums. The number of covered days before any ordinal x is
+
+    C(x) = sum(x - s for s < x) - sum(x - e for e < x)
+
+which is two bisects and two prefix-sum lookups, so the days falling in a
+bucket [a, b) are C(b) - C(a) whatever the length of the ranges. Per-month,
+per-year and per-family occupancy are batches of these lookups, cost
+O((ranges + buckets) * log ranges) instead of one step per booked day.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date
+from itertools import accumulate
+
+
+def clip_range(start, end, range_start, range_end):
+    """Overlap of two inclusive date ranges as (start, end), or None"""
+    overlap_start = max(start, range_start)
+    overlap_end = min(end, range_end)
+    if overlap_start > overlap_end:
+        return None
+    return overlap_start, overlap_end
+
+
+def month_boundaries(first_year, last_year):
+    """
+    Ordinals of the first day of every month from January first_year to
+    January last_year + 1, with the (year, month) label of each bucket.
+    """
+    boundaries = []
+    labels = []
+    for year in range(first_year, last_year + 1):
+        for month in range(1, 13):
+            boundaries.append(date(year, month, 1).toordinal())
+            labels.append((year, month))
+    boundaries.append(date(last_year + 1, 1, 1).toordinal())
+    return boundaries, labels
+
+
+class DayCoverage:
+    """Occupancy of a collection of inclusive (start_date, end_date) ranges"""
+
+    def __init__(self, ranges=()):
+        pairs = [(s.toordinal(), e.toordinal() + 1) for s, e in ranges if s <= e]
+        self._starts = sorted(s for s, _ in pairs)
+        self._ends = sorted(e for _, e in pairs)  # exclusive
+        self._start_sums = [0] + list(accumulate(self._starts))
+        self._end_sums = [0] + list(accumulate(self._ends))
+
+    def __len__(self):
+        return len(self._starts)
+
+    @property
+    def first_day(self):
+        return date.fromordinal(self._starts[0]) if self._starts else None
+
+    @property
+    def last_day(self):
+        return date.fromordinal(self._ends[-1] - 1) if self._ends else None
+
+    def covered_before(self, ordinal):
+        """Total booked days strictly before the given day ordinal (C(x) above)"""
+        n_started = bisect_left(self._starts, ordinal)
+        n_ended = bisect_left(self._ends, ordinal)
+        return (
+            (n_started * ordinal - self._start_sums[n_started])
+            - (n_ended * ordinal - self._end_sums[n_ended])
+        )
+
+    def days_between(self, start, end):
+        """Booked days falling inside [start, end] (inclusive dates)"""
+        return self.covered_before(end.toordinal() + 1) - self.covered_before(start.toordinal())
+
+    def bucket_days(self, boundaries):
+        """Booked days in each bucket [boundaries[i], boundaries[i+1])"""
+        cumulative = [self.covered_before(b) for b in boundaries]
+        return [hi - lo for lo, hi in zip(cumulative, cumulative[1:])]
+
+    def bucket_counts(self, boundaries):
+        """Number of ranges touching each bucket [boundaries[i], boundaries[i+1])"""
+        started = [bisect_left(self._starts, b) for b in boundaries]
+        # Ranges ending (exclusive) at or before the bucket start do not touch it
+        ended = [bisect_left(self._ends, b + 1) for b in boundaries]
+        return [started[i + 1] - ended[i] for i in range(len(boundaries) - 1)]
+
+    def per_month(self):
+        """{(year, month): (days, ranges)} for every month with booked days"""
+        if not self._starts:
+            return {}
+        boundaries, labels = month_boundaries(self.first_day.year, self.last_day.year)
+        days = self.bucket_days(boundaries)
+        counts = self.bucket_counts(boundaries)
+        return {
+            label: (d, c)
+            for label, d, c in zip(labels, days, counts)
+            if d
+        }
+
+    def per_year(self):
+        """{year: (days, ranges)} for every year with booked days"""
+        if not self._starts:
+            return {}
+        years = list(range(self.first_day.year, self.last_day.year + 1))
+        boundaries = [date(y, 1, 1).toordinal() for y in years] + [date(years[-1] + 1, 1, 1).toordinal()]
+        days = self.bucket_days(boundaries)
+        counts = self.bucket_counts(boundaries)
+        return {
+            year: (d, c)
+            for year, d, c in zip(years, days, counts)
+            if d
+        }
+
+
+def coverage_by_key(rows):
+    """Build one DayCoverage per key from (key, start_date, end_date) rows"""
+    grouped = defaultdict(list)
+    for key, start, end in rows:
+        grouped[key].append((start, end))
+    return {key: DayCoverage(ranges) for key, ranges in grouped.items()}
@@ -1,36 +1,74 @@
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
+from django.utils.dateparse import parse_date
 import logging
-from .whatsapp_utils import send_whatsapp_notification, format_message_for_whatsapp
+from .mail_delivery import html_email, send_email_batch
+from .whatsapp_utils import send_whatsapp_batch, format_message_for_whatsapp
 from django.contrib.auth.models import User
 
 logger = logging.getLogger(__name__)
 
-def send_booking_notification(booking, action_type, extra_context=None):
+def notification_recipient_family(booking, action_type):
+    """Family that has to be told about this action, or None if nobody is pending"""
+    if action_type == 'approved':
+        # Send to the booking owner (requester) to confirm approval
+        return booking.family_group
+    # Send to whoever needs to act next
+    return booking.pending_with or None
+
+
+def queue_booking_notification(booking, action_type, extra_context=None):
     """
-    Send email notification for booking actions that require approval.
-    
+    Queue a booking notification in the outbox.
+
+    The row is written in the caller's transaction, so it exists only if the
+    booking change is committed; the process_notifications worker delivers it.
+
     Args:
         booking: Booking instance
-        action_type: Type of action ('created', 'approved', 'rejected', 'deroga_requested', 'modified')
-        extra_context: Additional context for email template
+        action_type: Type of action ('created', 'approved', 'rejected', 'deroga_requested', 'modified', 'period_reduced')
+        extra_context: Additional context for email template (JSON serialisable, dates allowed)
+    """
+    from .models import NotificationOutbox
+
+    recipient_family = notification_recipient_family(booking, action_type)
+    if not recipient_family:
+        return None  # No action needed if nobody is pending
+
+    return NotificationOutbox.objects.create(
+        booking=booking,
+        action_type=action_type,
+        recipient_family=recipient_family,
+        extra_context=extra_context or {},
+    )
+
+
+def decode_extra_context(extra_context):
+    """Turn the ISO dates stored by DjangoJSONEncoder back into dates for the |date filter"""
+    decoded = {}
+    for key, value in (extra_context or {}).items():
+        if isinstance(value, str) and len(value) == 10:
+            try:
+                value = parse_date(value) or value
+            except ValueError:
+                pass
+        decoded[key] = value
+    return decoded
+
+
+def deliver_booking_notification(booking, action_type, recipient_family, extra_context=None, batch=None):
+    """
+    Send the email (and WhatsApp messages) for a booking action, over the
+    EmailBatch connection when one is given.
+
+    Raises if the email cannot be sent, so the outbox worker can retry it.
+    Returns False when no email address is configured for the family.
     """
-    # Determine recipient based on action type
-    if action_type == 'approved':
-        # Send to the booking owner (requester) to confirm approval
-        recipient_family = booking.family_group
-    elif booking.pending_with:
-        # Send to whoever needs to act next
-        recipient_family = booking.pending_with
-    else:
-        return  # No action needed if nobody is pending
-    
     recipient_email = settings.FAMILY_EMAILS.get(recipient_family)
     
     if not recipient_email:
         logger.warning(f"No email configured for family: {recipient_family}")
-        return
+        return False
     
     # Prepare context for email template
     context = {
@@ -58,44 +96,46 @@ def send_booking_notification(booking, action_type, extra_context=None):
     # Render HTML email
     html_message = render_to_string('bookings/emails/booking_notification.html', context)
     
+    message = html_email(subject, html_message, [recipient_email])
+    if batch is None:
+        result = send_email_batch([message])[0]
+    else:
+        result = batch.send(message)
+    if result.error is not None:
+        raise result.error
+    logger.info(f"Email sent to {recipient_email} for booking {booking.id} - {action_type}")
+    
+    # --- WhatsApp Integration ---
+    # Best effort: a WhatsApp failure must not trigger a retry of the email
     try:
-        send_mail(
-            subject=subject,
-            message='',  # Plain text version (empty for HTML-only)
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[recipient_email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        logger.info(f"Email sent to {recipient_email} for booking {booking.id} - {action_type}")
+        # Find users in the recipient family who have WhatsApp enabled
+        recipients = User.objects.filter(
+            profile__family_group=recipient_family,
+            profile__whatsapp_enabled=True
+        ).select_related('profile')
         
-        # --- WhatsApp Integration ---
-        try:
-            # Find users in the recipient family who have WhatsApp enabled
-            # Note: We import User inside function or at top. Added at top.
-            recipients = User.objects.filter(
-                profile__family_group=recipient_family,
-                profile__whatsapp_enabled=True
-            )
-            
-            if recipients.exists():
-                # Prepare WhatsApp message
-                # We need a summary text. The 'extra_context' might have it, or we deduce it.
-                # Actually, subject is a good summary header.
-                wa_context = context.copy()
-                wa_context['summary'] = subject # Use subject as summary for now
-                wa_message = format_message_for_whatsapp(subject, wa_context)
-                
-                for user in recipients:
-                    profile = user.profile
-                    if profile.phone and profile.callmebot_apikey:
-                        success = send_whatsapp_notification(profile.phone, wa_message, profile.callmebot_apikey)
-                        if success:
-                            logger.info(f"WhatsApp sent to {user.username} ({profile.phone})")
-                        else:
-                            logger.warning(f"Failed to send WhatsApp to {user.username}")
-        except Exception as e:
-            logger.error(f"Error in WhatsApp dispatch: {str(e)}")
+        if recipients.exists():
+            # Subject is a good summary header for the WhatsApp message
+            wa_context = context.copy()
+            wa_context['summary'] = subject
+            wa_message = format_message_for_whatsapp(subject, wa_context)
             
+            targets = {}
+            for user in recipients:
+                profile = user.profile
+                if profile.phone and profile.callmebot_apikey:
+                    targets[profile.phone] = (user.username, profile.callmebot_apikey)
+
+            # All recipients in parallel, bounded by WHATSAPP_DEADLINE
+            results = send_whatsapp_batch(
+                [(phone, api_key) for phone, (_, api_key) in targets.items()], wa_message
+            )
+            for phone, success in results.items():
+                username = targets[phone][0]
+                if success:
+                    logger.info(f"WhatsApp sent to {username} ({phone})")
+                else:
+                    logger.warning(f"Failed to send WhatsApp to {username}")
     except Exception as e:
-        logger.error(f"Failed to send email to {recipient_email}: {str(e)}")
+        logger.error(f"Error in WhatsApp dispatch: {str(e)}")
+    return True
@@ -0,0 +1,329 @@
+"""
+Shared asynchronous Home Assistant REST client.
+
+The thermostat views are async and call Home Assistant through one
+keep-alive httpx.AsyncClient (connection pool, auth headers set once), so a
+slow or unreachable HA only parks coroutines on the event loop instead of
+tying up the threads that serve the sync booking views.
+
+GET /api/states/<entity> responses are cached for HA_STATE_CACHE_TTL
+seconds, so the utilities page polling status and schedule together hits
+Home Assistant at most once per entity per TTL. Any service call (set
+temperature/preset/schedule) drops the whole cache, since changing the
+schedule also changes the climate entity.
+
+A circuit breaker opens after HA_BREAKER_THRESHOLD consecutive connection
+errors or 5xx responses. While it is open, calls fail fast and reads are
+answered with the last known state plus its age; after
+HA_BREAKER_COOLDOWN seconds the next call is let through as the single
+probe: a read revalidates in the background, a service call is sent as is.
+Either closes the breaker (and refreshes the state) if Home Assistant
+answers again.
+
+Each event loop gets its own AsyncClient (a pool is bound to the loop that
+opened its connections). A client is closed on its own loop when that loop
+shuts down: an async generator registered with the loop is finalised by
+loop.shutdown_asyncgens(), which asyncio.run() and async_to_sync() call
+before closing their loops. Daphne's loop lives as long as the process.
+"""
+import asyncio
+import threading
+import time
+
+import httpx
+from django.conf import settings
+
+from .metrics import HA_LATENCY
+from .request_timing import external_call
+
+HA_NOT_CONFIGURED = 'Home Assistant non configurato'
+HA_UNAVAILABLE = 'Home Assistant non raggiungibile, riprova tra poco'
+
+
+class HomeAssistantNotConfigured(Exception):
+    pass
+
+
+class HomeAssistantUnavailable(Exception):
+    """Circuit breaker open and no last known state to serve"""
+    pass
+
+
+def is_breaker_failure(error):
+    """Connection problems and HA server errors count; 4xx (bad token, unknown entity) do not"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> (background probe) -> closed"""
+
+    def __init__(self, threshold=None, cooldown=None):
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None  # monotonic time, None while closed
+        self.probing = False
+
+    @property
+    def threshold(self):
+        return self._threshold or getattr(settings, 'HA_BREAKER_THRESHOLD', 3)
+
+    @property
+    def cooldown(self):
+        return self._cooldown or getattr(settings, 'HA_BREAKER_COOLDOWN', 30)
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                # (Re)open: a failed probe restarts the cooldown
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        with self._lock:
+            self.probing = False
+
+    def claim_probe(self):
+        """True for the single caller that should probe HA now"""
+        with self._lock:
+            if (self.opened_at is None or self.probing
+                    or time.monotonic() - self.opened_at < self.cooldown):
+                return False
+            self.probing = True
+            return True
+
+
+def climate_entity():
+    return getattr(settings, 'HA_CLIMATE_ENTITY', 'climate.salotto')
+
+
+def select_entity():
+    return getattr(settings, 'HA_SELECT_ENTITY', 'select.pinzolo')
+
+
+def stale_marker(age_seconds):
+    """Extra fields telling the page the state is the last known one"""
+    if age_seconds is None:
+        return {}
+    return {'stale': True, 'age_seconds': age_seconds}
+
+
+def thermostat_payload(data, age_seconds=None):
+    """JSON shape of the climate entity used by the utilities page"""
+    attributes = data.get('attributes', {})
+    return {
+        'state': data.get('state'),
+        'current_temperature': attributes.get('current_temperature'),
+        'target_temperature': attributes.get('temperature'),
+        'hvac_action': attributes.get('hvac_action'),
+        'preset_mode': attributes.get('preset_mode'),
+        'min_temp': attributes.get('min_temp', 7),
+        'max_temp': attributes.get('max_temp', 30),
+        **stale_marker(age_seconds),
+    }
+
+
+def schedule_payload(data, age_seconds=None):
+    """JSON shape of the schedule select entity used by the utilities page"""
+    return {
+        'current': data.get('state'),
+        'options': data.get('attributes', {}).get('options', []),
+        **stale_marker(age_seconds),
+    }
+
+
+def _close_with_loop(client):
+    """Async generator closing the client when the running loop shuts down (keep a reference)"""
+    async def closer():
+        try:
+            yield
+        finally:
+            await client.aclose()
+
+    gen = closer()
+    # The first __anext__() registers the generator with the running loop
+    asyncio.ensure_future(gen.__anext__())
+    return gen
+
+
+class HomeAssistantClient:
+    """HA client with a pooled AsyncClient and a short-TTL state cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}  # loop -> (config, AsyncClient, closer)
+        self._config = None
+        self._states = {}  # entity_id -> (fetched_at, data)
+        self._last_known = {}  # entity_id -> (wall clock fetched_at, data), survives invalidation
+        self.breaker = CircuitBreaker()
+        self._inflight = {}  # (loop, entity_id) -> Task, one fetch at a time per entity
+
+    @property
+    def base_url(self):
+        return getattr(settings, 'HA_URL', '').rstrip('/')
+
+    @property
+    def configured(self):
+        return bool(self.base_url and getattr(settings, 'HA_TOKEN', ''))
+
+    def _timeout(self):
+        return getattr(settings, 'HA_TIMEOUT', 10)
+
+    def _ttl(self):
+        return getattr(settings, 'HA_STATE_CACHE_TTL', 5)
+
+    def client(self):
+        """AsyncClient for the running event loop (a new URL/token gets a fresh client and cache)"""
+        if not self.configured:
+            raise HomeAssistantNotConfigured()
+        token = getattr(settings, 'HA_TOKEN', '')
+        config = (self.base_url, token)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._config != config:
+                self._states.clear()
+                self._config = config
+            for closed in [l for l in self._clients if l.is_closed()]:
+                del self._clients[closed]  # Already closed by its shutdown_asyncgens()
+            entry = self._clients.get(loop)
+            if entry is not None and entry[0] == config:
+                return entry[1]
+            if entry is not None:
+                # Same loop, old URL/token: close its pool in the background
+                loop.create_task(entry[2].aclose())
+            client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={
+                    'Authorization': f'Bearer {token}',
+                    'Content-Type': 'application/json',
+                },
+                timeout=self._timeout(),
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+            )
+            self._clients[loop] = (config, client, _close_with_loop(client))
+            return client
+
+    def _cached(self, entity_id):
+        with self._lock:
+            entry = self._states.get(entity_id)
+        if entry and time.monotonic() - entry[0] < self._ttl():
+            return entry[1]
+        return None
+
+    async def _request(self, method, url, **kwargs):
+        """One HA request, with the outcome recorded on the breaker and in the metrics"""
+        started = time.monotonic()
+        try:
+            with external_call('ha'):
+                response = await self.client().request(method, url, **kwargs)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            if is_breaker_failure(e):
+                self.breaker.record_failure()
+                outcome = 'error'
+            else:
+                self.breaker.record_success()  # HA answered, it is reachable
+                outcome = 'client_error'
+            HA_LATENCY.observe(time.monotonic() - started, method=method, outcome=outcome)
+            raise
+        self.breaker.record_success()
+        HA_LATENCY.observe(time.monotonic() - started, method=method, outcome='ok')
+        return response
+
+    async def _fetch_state(self, entity_id):
+        response = await self._request('GET', f'/api/states/{entity_id}')
+        data = response.json()
+        with self._lock:
+            self._states[entity_id] = (time.monotonic(), data)
+            self._last_known[entity_id] = (time.time(), data)
+        return data
+
+    def _fetch_shared(self, entity_id):
+        """Task fetching the entity; concurrent misses for the same entity share it"""
+        key = (asyncio.get_running_loop(), entity_id)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_state(entity_id))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    def _stale(self, entity_id, error):
+        """(data, age_seconds) of the last known state, or raise"""
+        with self._lock:
+            entry = self._last_known.get(entity_id)
+        if entry is None:
+            raise error
+        fetched_at, data = entry
+        return data, int(time.time() - fetched_at)
+
+    def _probe_done(self, task):
+        # Nobody awaits the probe: consume its outcome and free the probe slot
+        # even if the task was cancelled before reaching the breaker
+        if not task.cancelled():
+            task.exception()
+        self.breaker.release_probe()
+
+    async def get_state(self, entity_id):
+        """
+        State of an entity (GET /api/states/<entity_id>) as (data, age_seconds).
+        age_seconds is None for a fresh state and the staleness of the last known
+        state when Home Assistant cannot be reached.
+        """
+        self.client()  # Raises HomeAssistantNotConfigured early
+        data = self._cached(entity_id)
+        if data is not None:
+            return data, None
+
+        if self.breaker.is_open:
+            if self.breaker.claim_probe():
+                # Revalidate in the background; this request gets the stale state
+                task = self._fetch_shared(entity_id)
+                task.add_done_callback(self._probe_done)
+            return self._stale(entity_id, HomeAssistantUnavailable())
+
+        try:
+            return await asyncio.shield(self._fetch_shared(entity_id)), None
+        except httpx.HTTPError as e:
+            if not is_breaker_failure(e):
+                raise
+            return self._stale(entity_id, e)
+
+    async def call_service(self, domain, service, data):
+        """POST /api/services/<domain>/<service> and drop the cached states"""
+        probe = False
+        if self.breaker.is_open:
+            # After the cooldown the call itself is the probe
+            probe = self.breaker.claim_probe()
+            if not probe:
+                raise HomeAssistantUnavailable()
+        try:
+            return await self._request('POST', f'/api/services/{domain}/{service}', json=data)
+        finally:
+            if probe:
+                self.breaker.release_probe()
+            self.invalidate()
+
+    def invalidate(self, entity_id=None):
+        with self._lock:
+            if entity_id is None:
+                self._states.clear()
+            else:
+                self._states.pop(entity_id, None)
+
+
+ha_client = HomeAssistantClient()
@@ -0,0 +1,155 @@
+"""
+Single shared poller of the Home Assistant thermostat state.
+
+Instead of every open utilities page polling the thermostat endpoints, the
+ThermostatConsumer subscribes here: one asyncio task (started with the first
+subscriber, stopped with the last) reads the climate and schedule entities
+every HA_POLL_INTERVAL seconds through ha_client (so the state cache and
+circuit breaker apply) and pushes the snapshot to the 'thermostat' channel
+group only when it changes. Load on Home Assistant is the same whatever the
+number of open tabs. Set-* views call wake() to refresh right away.
+
+With several server processes only the holder of the POLLER_LEASE (see
+SQLiteChannelLayer.acquire_lease) polls; the others keep trying to take it
+over at every interval and learn the snapshot from the group messages. A
+wake() polls once in any process, since the change was made there.
+"""
+import asyncio
+import logging
+
+import httpx
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .ha_client import (
+    ha_client, climate_entity, select_entity, thermostat_payload, schedule_payload,
+    HomeAssistantNotConfigured, HomeAssistantUnavailable, HA_NOT_CONFIGURED, HA_UNAVAILABLE,
+)
+
+logger = logging.getLogger(__name__)
+
+THERMOSTAT_GROUP = 'thermostat'
+POLLER_LEASE = 'ha_poller'
+
+
+def _without_age(payload):
+    # The age marker grows at every poll while HA is down; it is not a change
+    if not isinstance(payload, dict):
+        return payload
+    return {k: v for k, v in payload.items() if k != 'age_seconds'}
+
+
+class HomeAssistantPoller:
+    def __init__(self):
+        self.snapshot = None  # {'thermostat': ..., 'schedule': ..., 'error': ...}
+        self._subscribers = 0
+        self._task = None
+        self._wake = None
+
+    def _interval(self):
+        return getattr(settings, 'HA_POLL_INTERVAL', 15)
+
+    def subscribe(self):
+        """Register a listener; starts the polling task on the running loop if needed"""
+        self._subscribers += 1
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    def unsubscribe(self):
+        self._subscribers = max(0, self._subscribers - 1)
+        if self._subscribers == 0 and self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self.snapshot = None  # The next subscriber gets a fresh read
+
+    def remember(self, snapshot):
+        """Snapshot broadcast by whichever process polled (sent to new subscribers)"""
+        if self._subscribers:
+            self.snapshot = snapshot
+
+    def wake(self):
+        """Poll now (after a set-* call) instead of waiting for the interval"""
+        if self._wake is not None and self._task is not None and not self._task.done():
+            self._wake.set()
+
+    async def read_state(self):
+        snapshot = {'thermostat': None, 'schedule': None, 'error': None}
+        try:
+            data, age_seconds = await ha_client.get_state(climate_entity())
+            snapshot['thermostat'] = thermostat_payload(data, age_seconds)
+            data, age_seconds = await ha_client.get_state(select_entity())
+            snapshot['schedule'] = schedule_payload(data, age_seconds)
+        except HomeAssistantNotConfigured:
+            snapshot['error'] = HA_NOT_CONFIGURED
+        except HomeAssistantUnavailable:
+            snapshot['error'] = HA_UNAVAILABLE
+        except httpx.HTTPError as e:
+            snapshot['error'] = f'Errore connessione HA: {str(e)}'
+        return snapshot
+
+    def _changed(self, snapshot):
+        if self.snapshot is None:
+            return True
+        return any(
+            _without_age(snapshot[key]) != _without_age(self.snapshot[key])
+            for key in ('thermostat', 'schedule', 'error')
+        )
+
+    async def poll_once(self):
+        snapshot = await self.read_state()
+        changed = self._changed(snapshot)
+        # Keep the latest age markers for clients connecting later
+        self.snapshot = snapshot
+        if changed:
+            await get_channel_layer().group_send(THERMOSTAT_GROUP, {
+                'type': 'thermostat.state',
+                'state': snapshot,
+            })
+
+    async def _holds_lease(self):
+        acquire = getattr(get_channel_layer(), 'acquire_lease', None)
+        if acquire is None:
+            return True  # Process-local layer: this is the only poller
+        try:
+            # Three intervals without a renewal and another process takes over
+            return await acquire(POLLER_LEASE, self._interval() * 3)
+        except Exception:
+            logger.exception("Could not acquire the Home Assistant poller lease")
+            return False
+
+    async def _release_lease(self):
+        release = getattr(get_channel_layer(), 'release_lease', None)
+        if release is None:
+            return
+        try:
+            await release(POLLER_LEASE)
+        except Exception:
+            logger.exception("Could not release the Home Assistant poller lease")
+
+    async def _run(self):
+        leader = False
+        woken = False
+        try:
+            while True:
+                try:
+                    leader = await self._holds_lease()
+                    if leader or woken:
+                        await self.poll_once()
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception("Home Assistant poll failed")
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self._interval())
+                    woken = True
+                except asyncio.TimeoutError:
+                    woken = False
+                self._wake.clear()
+        finally:
+            if leader:
+                # Let a process that still has subscribers take over right away
+                await self._release_lease()
+
+
+ha_poller = HomeAssistantPoller()
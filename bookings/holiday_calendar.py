@@ -0,0 +1,80 @@
+"""
+Process-cached table of Italian holidays and bridge days (ponti), per year.
+
+Each year is computed once with holidays.Italy() and kept as sorted ordinal
+arrays, so range queries (calendar background events, bridges inside a
+booking) are two bisects instead of a day-by-day walk.
+"""
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import date
+from functools import lru_cache
+
+import holidays
+
+# A "ponte" is a holiday that falls on:
+# - Monday (ponte with preceding weekend)
+# - Tuesday (super-ponte if Monday is taken off)
+# - Thursday (ponte if Friday is taken off)
+# - Friday (ponte with following weekend)
+BRIDGE_TYPES = {
+    0: "Ponte Lunedì",
+    1: "Super-Ponte Martedì",
+    3: "Ponte Giovedì",
+    4: "Ponte Venerdì",
+}
+
+Holiday = namedtuple('Holiday', ['date', 'name', 'bridge_type'])
+YearTable = namedtuple('YearTable', ['ordinals', 'holidays', 'bridge_ordinals', 'bridges'])
+
+
+@lru_cache(maxsize=64)
+def year_table(year):
+    """Sorted holidays of the year, with the bridge classification precomputed"""
+    entries = [
+        Holiday(day, name, BRIDGE_TYPES.get(day.weekday()))
+        for day, name in sorted(holidays.Italy(years=year).items())
+    ]
+    bridges = [h for h in entries if h.bridge_type]
+    return YearTable(
+        ordinals=[h.date.toordinal() for h in entries],
+        holidays=entries,
+        bridge_ordinals=[h.date.toordinal() for h in bridges],
+        bridges=bridges,
+    )
+
+
+def _slice(ordinals, values, start, end):
+    lo = bisect_left(ordinals, start.toordinal())
+    hi = bisect_right(ordinals, end.toordinal())
+    return values[lo:hi]
+
+
+def holidays_in_range(start, end):
+    """Holidays between start and end (both inclusive)"""
+    result = []
+    for year in range(start.year, end.year + 1):
+        table = year_table(year)
+        result.extend(_slice(table.ordinals, table.holidays, start, end))
+    return result
+
+
+def holidays_for_years(start_year, end_year):
+    return holidays_in_range(date(start_year, 1, 1), date(end_year, 12, 31))
+
+
+def get_bridge_days(start, end):
+    """
+    Identify bridge days (ponti) within a booking period.
+    Returns a list of {'date', 'name', 'type'} dicts (fresh, callers may annotate them)
+    """
+    result = []
+    for year in range(start.year, end.year + 1):
+        table = year_table(year)
+        for bridge in _slice(table.bridge_ordinals, table.bridges, start, end):
+            result.append({
+                'date': bridge.date,
+                'name': bridge.name,
+                'type': bridge.bridge_type,
+            })
+    return result
@@ -0,0 +1,101 @@
+"""
+Batched email delivery over a single SMTP session.
+
+send_mail() opens (and TLS-negotiates) a new connection for every call.
+EmailBatch keeps one get_connection() session open for a whole burst of
+messages (outbox worker, cron reminders) and sends them one by one over it,
+so every message gets its own DeliveryResult instead of the whole batch
+failing on the first error.
+
+An idle session the server has closed is detected with a NOOP and reopened
+before the message goes out. A failure while sending is never retried here:
+the server may already have accepted the DATA, and resending would deliver
+the message twice. The outbox retries it later (at-least-once delivery).
+"""
+import logging
+import smtplib
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+logger = logging.getLogger(__name__)
+
+DeliveryResult = namedtuple('DeliveryResult', ['message', 'sent', 'error'])
+
+
+def html_email(subject, html_message, recipient_list, from_email=None):
+    """HTML-only message, same shape as send_mail(message='', html_message=...)"""
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body='',
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=recipient_list,
+    )
+    message.attach_alternative(html_message, 'text/html')
+    return message
+
+
+class EmailBatch:
+    """One SMTP session shared by many messages. Use as a context manager."""
+
+    def __init__(self):
+        self.connection = get_connection(fail_silently=False)
+        self.results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        try:
+            self.connection.close()
+        except Exception as e:
+            logger.warning(f"Error closing mail connection: {e}")
+
+    def _reopen_if_stale(self):
+        """Reopen the session if the server dropped it while idle (before any DATA)"""
+        smtp = getattr(self.connection, 'connection', None)
+        if smtp is None or not hasattr(smtp, 'noop'):
+            return
+        try:
+            alive = smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            alive = False
+        if not alive:
+            self.close()
+
+    def send(self, message):
+        """Send one message over the shared connection and return its DeliveryResult"""
+        sent, error = False, None
+        try:
+            self._reopen_if_stale()
+            # No-op when the connection is already open
+            self.connection.open()
+            sent = bool(self.connection.send_messages([message]))
+            if not sent:
+                error = RuntimeError('backend reported 0 messages sent')
+        except Exception as e:
+            error = e
+
+        if error is not None:
+            logger.error(f"Failed to send email to {', '.join(map(str, message.to))}: {error}")
+        result = DeliveryResult(message, sent, error)
+        self.results.append(result)
+        return result
+
+    @property
+    def sent_count(self):
+        return sum(1 for r in self.results if r.sent)
+
+    @property
+    def failed_count(self):
+        return len(self.results) - self.sent_count
+
+
+def send_email_batch(messages):
+    """Send messages over one connection; returns their DeliveryResults in order"""
+    with EmailBatch() as batch:
+        return [batch.send(message) for message in messages]
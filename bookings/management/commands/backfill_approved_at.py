@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Subquery, OuterRef
+from bookings.models import Booking, BookingAudit
+
+
+class Command(BaseCommand):
+    help = 'Fill Booking.approved_at from the audit log for bookings approved before the field existed'
+
+    def handle(self, *args, **kwargs):
+        # Latest approval recorded in the audit log (manual or via ownership period)
+        approval_date_subquery = BookingAudit.objects.filter(
+            booking=OuterRef('pk'),
+            action__in=['APPROVED', 'AUTO_APPROVED']
+        ).order_by('-timestamp').values('timestamp')[:1]
+
+        updated = Booking.objects.filter(
+            approved_at__isnull=True,
+            status__in=['APPROVED', 'DEROGA'],
+            audits__action__in=['APPROVED', 'AUTO_APPROVED'],
+        ).distinct().update(approved_at=Subquery(approval_date_subquery))
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled approved_at on {updated} bookings'))
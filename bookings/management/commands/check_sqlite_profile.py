@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+# PRAGMA answers are numbers for these keyword settings
+PRAGMA_KEYWORDS = {
+    'synchronous': {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3},
+    'temp_store': {'DEFAULT': 0, 'FILE': 1, 'MEMORY': 2},
+}
+
+
+def normalize(name, value):
+    if isinstance(value, str):
+        keyword = value.upper()
+        if keyword in PRAGMA_KEYWORDS.get(name, {}):
+            return PRAGMA_KEYWORDS[name][keyword]
+        try:
+            return int(value)
+        except ValueError:
+            return value.lower()
+    return value
+
+
+class Command(BaseCommand):
+    help = 'Verify that the SQLite production profile (SQLITE_PRAGMAS, transaction mode) is active'
+
+    def handle(self, *args, **kwargs):
+        if connection.vendor != 'sqlite':
+            raise CommandError(f'Database is {connection.vendor}, not SQLite')
+
+        expected = getattr(settings, 'SQLITE_PRAGMAS', {})
+        if not expected:
+            raise CommandError('SQLITE_PRAGMAS is not configured (are you using settings_prod?)')
+
+        mismatches = []
+        with connection.cursor() as cursor:
+            for name, value in expected.items():
+                cursor.execute(f'PRAGMA {name}')
+                actual = cursor.fetchone()[0]
+                ok = normalize(name, actual) == normalize(name, value)
+                self.stdout.write(f"{'OK  ' if ok else 'FAIL'} {name} = {actual} (expected {value})")
+                if not ok:
+                    mismatches.append(name)
+
+        # CONN_MAX_AGE is informational: 0 under Daphne, set for the notification worker
+        conn_max_age = connection.settings_dict.get('CONN_MAX_AGE', 0)
+        transaction_mode = connection.settings_dict.get('OPTIONS', {}).get('transaction_mode')
+        self.stdout.write(f"     CONN_MAX_AGE = {conn_max_age}, transaction_mode = {transaction_mode}")
+        if transaction_mode != 'IMMEDIATE':
+            mismatches.append('transaction_mode')
+
+        if mismatches:
+            raise CommandError(f"SQLite profile not active: {', '.join(mismatches)}")
+        self.stdout.write(self.style.SUCCESS(f"SQLite profile active on {connection.settings_dict['NAME']}"))
@@ -1,8 +1,9 @@
 from django.core.management.base import BaseCommand
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
-from bookings.models import ChatMessage, UserProfile
+from django.db.models import Max, Q
+from bookings.models import ChatMessage, ChatReadState, UserProfile
+from bookings.mail_delivery import EmailBatch, html_email
 from django.contrib.auth.models import User
 from collections import defaultdict
 
@@ -25,7 +26,21 @@ class Command(BaseCommand):
             except Exception as e:
                 self.stdout.write(self.style.WARNING(f'Failed to load state file: {e}'))
 
-        unread_messages = ChatMessage.objects.filter(is_read=False)
+        # A message is unread for the other family until one of its members
+        # has read past it (per-user read pointers, see ChatReadState)
+        read_pointers = dict(
+            ChatReadState.objects
+            .values('user__profile__family_group')
+            .annotate(last_read_id=Max('last_read_id'))
+            .values_list('user__profile__family_group', 'last_read_id')
+        )
+        unread_filter = Q()
+        for sender_family, recipient_family in (('Andrea', 'Fabrizio'), ('Fabrizio', 'Andrea')):
+            unread_filter |= Q(
+                sender__profile__family_group=sender_family,
+                id__gt=read_pointers.get(recipient_family) or 0,
+            )
+        unread_messages = ChatMessage.objects.filter(unread_filter).select_related('sender__profile')
         
         if not unread_messages.exists():
             self.stdout.write(self.style.SUCCESS('No unread messages found'))
@@ -51,59 +66,53 @@ class Command(BaseCommand):
                 current_state[sender_family] = []
             current_state[sender_family].append(msg.id)
 
-        # Send notifications
+        # Send notifications (one SMTP session for all of them)
         messages_sent = False
-        for family, messages in messages_by_family.items():
-            current_ids = set(m.id for m in messages)
-            previous_ids = set(previous_state.get(family, []))
+        with EmailBatch() as batch:
+            for family, messages in messages_by_family.items():
+                current_ids = set(m.id for m in messages)
+                previous_ids = set(previous_state.get(family, []))
             
-            # Only notify if there are NEW unread messages since last check
-            new_ids = current_ids - previous_ids
+                # Only notify if there are NEW unread messages since last check
+                new_ids = current_ids - previous_ids
             
-            if not new_ids:
-                self.stdout.write(f'Skipping notification for {family}: No new unread messages (Existing: {len(current_ids)})')
-                continue
+                if not new_ids:
+                    self.stdout.write(f'Skipping notification for {family}: No new unread messages (Existing: {len(current_ids)})')
+                    continue
 
-            count = len(messages) # Total unread count (we report total, but trigger only on new)
+                count = len(messages) # Total unread count (we report total, but trigger only on new)
             
-            # If sender is Andrea -> Notify Fabrizio
-            if family == 'Andrea':
-                recipient_email = settings.FAMILY_EMAILS.get('Fabrizio')
-                recipient_name = "Famiglia Fabrizio"
-                sender_name = "Famiglia Andrea"
-            # If sender is Fabrizio -> Notify Andrea
-            elif family == 'Fabrizio':
-                recipient_email = settings.FAMILY_EMAILS.get('Andrea')
-                recipient_name = "Famiglia Andrea"
-                sender_name = "Famiglia Fabrizio"
-            else:
-                self.stdout.write(self.style.WARNING(f"Unknown family group: {family}"))
-                continue
+                # If sender is Andrea -> Notify Fabrizio
+                if family == 'Andrea':
+                    recipient_email = settings.FAMILY_EMAILS.get('Fabrizio')
+                    recipient_name = "Famiglia Fabrizio"
+                    sender_name = "Famiglia Andrea"
+                # If sender is Fabrizio -> Notify Andrea
+                elif family == 'Fabrizio':
+                    recipient_email = settings.FAMILY_EMAILS.get('Andrea')
+                    recipient_name = "Famiglia Andrea"
+                    sender_name = "Famiglia Fabrizio"
+                else:
+                    self.stdout.write(self.style.WARNING(f"Unknown family group: {family}"))
+                    continue
 
-            subject = render_to_string('emails/chat_notification_subject.txt', {'sender_name': sender_name})
-            # Remove newlines from subject
-            subject = ''.join(subject.splitlines())
+                subject = render_to_string('emails/chat_notification_subject.txt', {'sender_name': sender_name})
+                # Remove newlines from subject
+                subject = ''.join(subject.splitlines())
             
-            html_message = render_to_string('emails/chat_notification_email.html', {
-                'recipient_name': recipient_name,
-                'sender_name': sender_name,
-                'count': count,
-                'app_url': settings.PRENOPINZO_BASE_URL,
-            })
+                html_message = render_to_string('emails/chat_notification_email.html', {
+                    'recipient_name': recipient_name,
+                    'sender_name': sender_name,
+                    'count': count,
+                    'app_url': settings.PRENOPINZO_BASE_URL,
+                })
             
-            try:
-                send_mail(
-                    subject,
-                    "", # Plain text message is empty as we use html_message
-                    settings.DEFAULT_FROM_EMAIL,
-                    [recipient_email],
-                    html_message=html_message,
-                    fail_silently=False,
-                )
-                self.stdout.write(self.style.SUCCESS(f'Sent notification to {recipient_name} regarding {count} unread messages from {sender_name}'))
-                messages_sent = True
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Failed to send email to {recipient_email}: {str(e)}'))
+                result = batch.send(html_email(subject, html_message, [recipient_email]))
+                if result.sent:
+                    self.stdout.write(self.style.SUCCESS(f'Sent notification to {recipient_name} regarding {count} unread messages from {sender_name}'))
+                    messages_sent = True
+                else:
+                    self.stdout.write(self.style.ERROR(f'Failed to send email to {recipient_email}: {result.error}'))
 
         # Save new state
         try:
@@ -0,0 +1,121 @@
+import re
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from bookings.models import ChatMessage, OwnershipPeriod, UserProfile
+
+# (label, table) full scans that are expected: every row is listed by design
+ALLOWED_FULL_SCANS = {
+    ('dashboard', 'bookings_ownershipperiod'),  # Periods card and modal
+    ('ownership periods', 'bookings_ownershipperiod'),
+    ('ical export', 'bookings_booking'),  # Whole calendar, all families
+}
+
+# 'SCAN x' since SQLite 3.36, 'SCAN TABLE x' before; index scans are 'SCAN x USING ...'
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)$')
+
+
+def page_requests():
+    """(label, url) of the GET views reading the database"""
+    today = date.today()
+    window = f"start={today.replace(day=1) - timedelta(days=7)}&end={today.replace(day=1) + timedelta(days=42)}"
+    return [
+        ('dashboard', reverse('dashboard')),
+        ('audit history', reverse('audit_history_page') + '?before=999999999'),
+        ('booking history', reverse('booking_history_page') + f'?before={today:%Y-%m-%d}_999999999'),
+        ('calendar feed (compact)', reverse('booking_events') + f'?format=compact&{window}'),
+        ('calendar feed', reverse('booking_events') + f'?{window}'),
+        ('statistics', reverse('statistics')),
+        ('ical export', reverse('export_ical')),
+        ('chat unread count', reverse('unread_chat_count')),
+        ('ownership periods', reverse('ownership_periods')),
+        ('ownership periods api', reverse('ownership_periods_api')),
+    ]
+
+
+def hot_paths(user):
+    """(label, callable) of the model helpers used by the write views and the chat"""
+    family = user.profile.family_group
+    start = date.today()
+    end = start + timedelta(days=7)
+    return [
+        ('ownership auto-approve check', lambda: OwnershipPeriod.is_within_ownership(family, start, end)),
+        ('ownership overlap check', lambda: OwnershipPeriod.check_overlap_with_other_family(family, start, end)),
+        ('chat unread count', lambda: ChatMessage.unread_count_for(user)),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN QUERY PLAN on the queries of the main views and fail on unexpected full table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='User the views are rendered for (default: first user with a profile, '
+                                                   'or a temporary one on an empty database)')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not only the scans')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN output is only understood for SQLite')
+
+        # Everything (sessions and the temporary user included) is rolled back at the end
+        with transaction.atomic():
+            users = User.objects.filter(profile__isnull=False)
+            if options['username']:
+                users = users.filter(username=options['username'])
+            user = users.order_by('id').first()
+            if user is None:
+                if options['username']:
+                    raise CommandError(f"No user {options['username']} with a profile")
+                user = User.objects.create_user('explain_queries')
+                UserProfile.objects.create(user=user, family_group=UserProfile.FAMILY_CHOICES[0][0])
+
+            client = Client()
+            client.force_login(user)
+            captured = []
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for label, url in page_requests():
+                    with CaptureQueriesContext(connection) as queries:
+                        response = client.get(url)
+                    if response.status_code != 200:
+                        self.stderr.write(f'{label}: HTTP {response.status_code} for {url}')
+                    captured.append((label, queries.captured_queries))
+            for label, func in hot_paths(user):
+                with CaptureQueriesContext(connection) as queries:
+                    func()
+                captured.append((label, queries.captured_queries))
+
+            problems = self.explain_all(captured, options['verbose_plans'])
+            transaction.set_rollback(True)
+
+        if problems:
+            raise CommandError(f'{problems} unexpected full table scan(s)')
+        self.stdout.write(self.style.SUCCESS('No unexpected full table scans'))
+
+    def explain_all(self, captured, verbose):
+        problems = 0
+        seen = set()
+        with connection.cursor() as cursor:
+            for label, queries in captured:
+                for query in queries:
+                    sql = query['sql']
+                    if not sql.lstrip().upper().startswith('SELECT') or sql in seen:
+                        continue
+                    seen.add(sql)
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                    plan = [row[-1] for row in cursor.fetchall()]
+                    scans = [
+                        match.group(1) for match in map(FULL_SCAN.match, plan)
+                        if match and (label, match.group(1)) not in ALLOWED_FULL_SCANS
+                    ]
+                    problems += len(scans)
+                    if scans or verbose:
+                        self.stdout.write(f"{'SCAN' if scans else 'ok  '} [{label}] {sql[:200]}")
+                        for step in plan:
+                            self.stdout.write(f'       {step}')
+        return problems
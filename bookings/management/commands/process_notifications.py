@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from bookings.outbox import process_due
+
+
+class Command(BaseCommand):
+    help = 'Deliver the booking notifications queued in the outbox (runs continuously unless --once)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the due notifications and exit')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls when idle')
+        parser.add_argument('--batch-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            sent, failed = process_due(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'Notifications sent: {sent}, failed: {failed}')
+
+            if options['once']:
+                # Keep draining until no full batch is left
+                if sent + failed < options['batch_size']:
+                    break
+                continue
+            if sent + failed < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from bookings.models import UsageStat, BridgeStat, ActionStat
+from bookings.usage_stats import rebuild_usage_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the statistics aggregates (days, bridges, actions) from bookings and audit logs'
+
+    def handle(self, *args, **kwargs):
+        rebuild_usage_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f'Statistics rebuilt: {UsageStat.objects.count()} usage rows, '
+            f'{BridgeStat.objects.count()} bridge rows, {ActionStat.objects.count()} action rows'
+        ))
@@ -0,0 +1,168 @@
+"""
+Process-local metrics in the Prometheus text exposition format (/metrics/).
+
+A deliberately small registry (counters, gauges, histograms with labels)
+instead of an extra dependency. The in-process series (request latency,
+open WebSockets, Home Assistant latency, SQLite write latency, lock waits
+and lock errors) describe the server process answering the scrape; the
+notification series are read from the outbox table at scrape time, so they
+also cover the worker process.
+"""
+import bisect
+import threading
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = defaultdict(float)
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            self._values[self._key(labels)] += amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f'{self.name}{_labels(self.labelnames, key)} {_number(value)}' for key, value in items]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):  # Above the last bound: only in +Inf
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, [("le", "+Inf")])} {series[-1]}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {series[-1]}')
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    'prenopinzo_request_duration_seconds', 'HTTP request latency by view name', ['view', 'method'],
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    'prenopinzo_websocket_connections', 'Open WebSocket connections by consumer', ['consumer'],
+)
+HA_LATENCY = Histogram(
+    'prenopinzo_ha_request_duration_seconds', 'Home Assistant request latency', ['method', 'outcome'],
+)
+SQLITE_WRITE_LATENCY = Histogram(
+    'prenopinzo_sqlite_write_duration_seconds', 'SQLite write statement duration, including the writer lock wait',
+)
+SQLITE_LOCK_WAITS = Counter(
+    'prenopinzo_sqlite_lock_waits_total', 'SQLite writes slower than SQLITE_LOCK_WAIT_THRESHOLD_MS',
+)
+SQLITE_LOCK_ERRORS = Counter(
+    'prenopinzo_sqlite_lock_errors_total', 'Queries failed with "database is locked" after the busy timeout',
+)
+
+REGISTRY = [
+    REQUEST_LATENCY, WEBSOCKET_CONNECTIONS, HA_LATENCY,
+    SQLITE_WRITE_LATENCY, SQLITE_LOCK_WAITS, SQLITE_LOCK_ERRORS,
+]
+
+
+def notification_lines():
+    """Outbox series, read from the database (shared by the web and worker processes)"""
+    from django.db.models import Count, Min, Sum
+    from django.utils import timezone
+
+    from .models import NotificationOutbox
+
+    rows = {
+        row['status']: row
+        for row in NotificationOutbox.objects.order_by().values('status').annotate(rows=Count('id'), attempts=Sum('attempts'))
+    }
+    oldest = NotificationOutbox.objects.filter(status='PENDING').aggregate(oldest=Min('created_at'))['oldest']
+    age = (timezone.now() - oldest).total_seconds() if oldest else 0
+
+    # Gauges, not counters: they are row counts and drop when old rows are pruned
+    failed_attempts = sum(row['attempts'] or 0 for row in rows.values())
+    lines = [
+        '# HELP prenopinzo_notifications Outbox notifications by status',
+        '# TYPE prenopinzo_notifications gauge',
+    ]
+    for status in ('PENDING', 'SENT', 'FAILED'):
+        lines.append(f'prenopinzo_notifications{{status="{status.lower()}"}} {rows.get(status, {}).get("rows", 0)}')
+    lines += [
+        '# HELP prenopinzo_notification_failed_attempts Failed delivery attempts recorded on the outbox rows',
+        '# TYPE prenopinzo_notification_failed_attempts gauge',
+        f'prenopinzo_notification_failed_attempts {failed_attempts}',
+        '# HELP prenopinzo_notification_oldest_pending_seconds Age of the oldest pending notification',
+        '# TYPE prenopinzo_notification_oldest_pending_seconds gauge',
+        f'prenopinzo_notification_oldest_pending_seconds {age:.1f}',
+    ]
+    return lines
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    lines += notification_lines()
+    return '\n'.join(lines) + '\n'
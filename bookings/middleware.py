@@ -0,0 +1,100 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import request_timing
+from .metrics import REQUEST_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Per-request limits; a request over any of them is logged with its breakdown
+DEFAULT_REQUEST_BUDGET = {'queries': 30, 'db_ms': 200, 'total_ms': 500}
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise that can sit in an async middleware chain.
+
+    WhiteNoiseMiddleware is sync-only, and a single sync middleware makes
+    Django run everything below it (async views included) in a worker
+    thread. Static files are still served in a thread; every other request
+    is passed on to the next handler on the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class RequestTimingMiddleware:
+    """
+    Adds a Server-Timing header (DB queries and time, template rendering,
+    external calls, total) to every response, records the latency for
+    /metrics/ and logs the requests over budget. Budgets come from REQUEST_BUDGET (queries, db_ms, total_ms),
+    with per-view overrides in REQUEST_BUDGET_OVERRIDES keyed by URL name.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings, token = request_timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_timing.stop(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings, token = request_timing.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_timing.stop(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        if getattr(settings, 'SERVER_TIMING_HEADER', True):
+            response['Server-Timing'] = timings.server_timing()
+
+        view_name = request.resolver_match.url_name if request.resolver_match else None
+        REQUEST_LATENCY.observe(timings.total_ms / 1000, view=view_name or 'unmatched', method=request.method)
+        budget = {**DEFAULT_REQUEST_BUDGET, **getattr(settings, 'REQUEST_BUDGET', {})}
+        budget.update(getattr(settings, 'REQUEST_BUDGET_OVERRIDES', {}).get(view_name, {}))
+        measured = {'queries': timings.queries, 'db_ms': timings.db_ms, 'total_ms': timings.total_ms}
+        exceeded = [key for key, limit in budget.items() if limit is not None and measured.get(key, 0) > limit]
+        if exceeded:
+            external = ', '.join(f'{service} {ms:.0f}ms' for service, ms in timings.external_ms.items()) or 'none'
+            logger.warning(
+                f"Over budget ({', '.join(exceeded)}): {request.method} {request.path} [{view_name}] "
+                f"{timings.queries} queries, db {timings.db_ms:.0f}ms, templates {timings.template_ms:.0f}ms, "
+                f"external {external}, total {timings.total_ms:.0f}ms"
+            )
+        return response
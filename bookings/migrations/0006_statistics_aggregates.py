@@ -0,0 +1,55 @@
+# Generated by Django 6.0 on 2026-10-18 00:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_booking_status_dates_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BridgeStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('family_group', models.CharField(choices=[('Andrea', 'Famiglia Andrea'), ('Fabrizio', 'Famiglia Fabrizio')], max_length=20)),
+                ('year', models.PositiveSmallIntegerField()),
+                ('bridge_type', models.CharField(max_length=50)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('family_group', 'year', 'bridge_type'), name='bridgestat_family_year_type')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UsageStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('family_group', models.CharField(choices=[('Andrea', 'Famiglia Andrea'), ('Fabrizio', 'Famiglia Fabrizio')], max_length=20)),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('days', models.IntegerField(default=0)),
+                ('periods', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('family_group', 'year', 'month'), name='usagestat_family_year_month')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ActionStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(max_length=100)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='action_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'action'), name='actionstat_user_action')],
+            },
+        ),
+    ]
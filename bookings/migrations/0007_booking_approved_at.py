@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 00:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_statistics_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='approved_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
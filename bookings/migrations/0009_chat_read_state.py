@@ -0,0 +1,59 @@
+# Generated by Django 6.0 on 2026-10-18 00:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+
+def init_read_pointers(apps, schema_editor):
+    """
+    Start each user's pointer just before the oldest message from somebody
+    else still flagged unread (or at the latest message if there is none).
+    """
+    User = apps.get_model('auth', 'User')
+    ChatMessage = apps.get_model('bookings', 'ChatMessage')
+    ChatReadState = apps.get_model('bookings', 'ChatReadState')
+
+    latest_id = ChatMessage.objects.aggregate(latest=Max('id'))['latest'] or 0
+    states = []
+    for user_id in User.objects.values_list('id', flat=True):
+        first_unread = (
+            ChatMessage.objects.filter(is_read=False).exclude(sender_id=user_id)
+            .aggregate(first=Min('id'))['first']
+        )
+        last_read_id = first_unread - 1 if first_unread else latest_id
+        states.append(ChatReadState(user_id=user_id, last_read_id=last_read_id))
+    ChatReadState.objects.bulk_create(states)
+
+
+def restore_is_read(apps, schema_editor):
+    """Flag as read what every user has read"""
+    ChatMessage = apps.get_model('bookings', 'ChatMessage')
+    ChatReadState = apps.get_model('bookings', 'ChatReadState')
+    read_by_all = ChatReadState.objects.aggregate(pointer=Min('last_read_id'))['pointer'] or 0
+    ChatMessage.objects.filter(id__lte=read_by_all).update(is_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('bookings', '0008_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatReadState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='chat_read_state', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('last_read_id', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(init_read_pointers, restore_is_read),
+        migrations.RemoveField(
+            model_name='chatmessage',
+            name='is_read',
+        ),
+    ]
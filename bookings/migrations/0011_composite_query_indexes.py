@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 00:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0010_chat_timestamp_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'pending_with', 'family_group'], name='booking_status_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['family_group', 'status'], name='booking_family_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['updated_at'], name='booking_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingaudit',
+            index=models.Index(fields=['booking', 'action', 'timestamp'], name='audit_booking_action_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingaudit',
+            index=models.Index(fields=['performed_by', 'action'], name='audit_user_action_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingaudit',
+            index=models.Index(fields=['timestamp'], name='audit_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ownershipperiod',
+            index=models.Index(fields=['family_group', 'start_date', 'end_date'], name='ownership_family_dates_idx'),
+        ),
+    ]
@@ -1,5 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .booking_index import booking_index
 
 class UserProfile(models.Model):
     FAMILY_CHOICES = [
@@ -51,10 +55,33 @@ class Booking(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Set when the other family (or an ownership period) approves the booking
+    approved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Calendar window queries: status filter + date range
+            models.Index(fields=['status', 'start_date', 'end_date'], name='booking_status_dates_idx'),
+            # Dashboard: requests waiting for a family (status + pending_with, minus its own)
+            models.Index(fields=['status', 'pending_with', 'family_group'], name='booking_status_pending_idx'),
+            # Statistics and iCal export: one family's bookings by status
+            models.Index(fields=['family_group', 'status'], name='booking_family_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.start_date} - {self.end_date})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stored state for the statistics delta of the next save (signals.py),
+        # unless the fields were deferred
+        from .usage_stats import BookingSnapshot
+        if all(field in field_names for field in BookingSnapshot._fields):
+            from .usage_stats import snapshot
+            instance._stats_snapshot = snapshot(instance)
+        return instance
+
     def get_other_group(self):
         if self.family_group == 'Andrea':
             return 'Fabrizio'
@@ -72,6 +99,7 @@ class Booking(models.Model):
         if self.status == 'NEGOTIATION':
             self.status = 'APPROVED'
             self.pending_with = None
+            self.approved_at = timezone.now()
             self.log_action('APPROVED', user)
         elif self.status == 'DEROGA':
             # Accept Deroga
@@ -136,22 +164,20 @@ class Booking(models.Model):
         self.save()
 
     @classmethod
-    def check_overlap(cls, start_date, end_date, exclude_id=None):
+    def find_overlaps(cls, start_date, end_date, exclude_id=None):
         """
-        Check if the given date range overlaps with any APPROVED or DEROGA booking.
+        Return the APPROVED or DEROGA bookings overlapping the given date range,
+        as BookingInterval tuples from the in-memory index (see booking_index.py).
         Logic: Overlap if (StartA < EndB) and (EndA > StartB).
         This allows touching dates (e.g. A ends 30th, B starts 30th) assuming
         check-out in morning and check-in in afternoon.
         """
-        query = cls.objects.filter(
-            status__in=['APPROVED', 'DEROGA'],
-            start_date__lt=end_date,
-            end_date__gt=start_date
-        )
-        if exclude_id:
-            query = query.exclude(id=exclude_id)
-        
-        return query.exists()
+        return booking_index.overlapping(start_date, end_date, exclude_id=exclude_id)
+
+    @classmethod
+    def check_overlap(cls, start_date, end_date, exclude_id=None):
+        """Check if the given date range overlaps with any APPROVED or DEROGA booking."""
+        return bool(cls.find_overlaps(start_date, end_date, exclude_id=exclude_id))
 
 class BookingAudit(models.Model):
     booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='audits')
@@ -160,6 +186,16 @@ class BookingAudit(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     details = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Latest approval of a booking (backfill_approved_at)
+            models.Index(fields=['booking', 'action', 'timestamp'], name='audit_booking_action_ts_idx'),
+            # Per-user action counts (usage_stats rebuild), covering
+            models.Index(fields=['performed_by', 'action'], name='audit_user_action_idx'),
+            # Dashboard: latest entries of the log
+            models.Index(fields=['timestamp'], name='audit_timestamp_idx'),
+        ]
+
     def __str__(self):
         return f"{self.action} on {self.booking} by {self.performed_by}"
 
@@ -180,6 +216,10 @@ class OwnershipPeriod(models.Model):
 
     class Meta:
         ordering = ['start_date']
+        indexes = [
+            # Auto-approve and overlap checks: one family's periods around a date range
+            models.Index(fields=['family_group', 'start_date', 'end_date'], name='ownership_family_dates_idx'),
+        ]
 
     def __str__(self):
         return f"{self.family_group}: {self.start_date} - {self.end_date}"
@@ -218,10 +258,143 @@ class ChatMessage(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Keyset pagination of the history (ChatConsumer.get_history_page)
+            models.Index(fields=['timestamp', 'id'], name='chat_timestamp_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender.username}: {self.content[:50]}"
+
+    @classmethod
+    def unread_count_for(cls, user):
+        """Messages from the other users after the user's read pointer (primary key range scan)"""
+        last_read_id = ChatReadState.last_read_id_for(user)
+        return cls.objects.filter(id__gt=last_read_id).exclude(sender=user).count()
+
+
+class ChatReadState(models.Model):
+    """Per-user chat read pointer: every message with id <= last_read_id has been read"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='chat_read_state')
+    last_read_id = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} read up to {self.last_read_id}"
+
+    @classmethod
+    def last_read_id_for(cls, user):
+        return cls.objects.filter(user=user).values_list('last_read_id', flat=True).first() or 0
+
+    @classmethod
+    def mark_read(cls, user):
+        """Move the user's pointer to the latest message. Returns True if it moved."""
+        latest_id = ChatMessage.objects.aggregate(latest=models.Max('id'))['latest'] or 0
+        # Single-row update; never moves the pointer backwards
+        if cls.objects.filter(user=user, last_read_id__lt=latest_id).update(
+                last_read_id=latest_id, updated_at=timezone.now()):
+            return True
+        _, created = cls.objects.get_or_create(user=user, defaults={'last_read_id': latest_id})
+        return created and latest_id > 0
+
+
+class NotificationOutbox(models.Model):
+    """
+    Booking notifications waiting for delivery. Rows are written in the same
+    transaction as the booking change and sent by the process_notifications worker.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'In coda'),
+        ('SENT', 'Inviata'),
+        ('FAILED', 'Fallita'),
+    ]
+
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='notifications')
+    action_type = models.CharField(max_length=50)
+    recipient_family = models.CharField(max_length=20, choices=Booking.FAMILY_CHOICES)
+    extra_context = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    # Next delivery attempt; also used as a lease while a worker is sending
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.action_type} for {self.booking} -> {self.recipient_family} ({self.status})"
+
+
+class DataVersion(models.Model):
+    """
+    Write counter of a table (versioning.py): bumped in the same transaction
+    as every write, so reading it is a primary key lookup.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+# ============================================================
+# Materialised statistics (maintained by usage_stats.py)
+# ============================================================
+
+class UsageStat(models.Model):
+    """
+    Approved days per family, year and month (month=0 is the whole year).
+    periods counts the approved bookings touching that year/month.
+    """
+    family_group = models.CharField(max_length=20, choices=Booking.FAMILY_CHOICES)
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    days = models.IntegerField(default=0)
+    periods = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['family_group', 'year', 'month'], name='usagestat_family_year_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.family_group} {self.year}/{self.month}: {self.days} days"
+
+
+class BridgeStat(models.Model):
+    """Bridge days (ponti) inside approved bookings, per family, year and bridge type"""
+    family_group = models.CharField(max_length=20, choices=Booking.FAMILY_CHOICES)
+    year = models.PositiveSmallIntegerField()
+    bridge_type = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['family_group', 'year', 'bridge_type'], name='bridgestat_family_year_type'),
+        ]
+
+    def __str__(self):
+        return f"{self.family_group} {self.year} {self.bridge_type}: {self.count}"
+
+
+class ActionStat(models.Model):
+    """BookingAudit actions performed by each user"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='action_stats')
+    action = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'action'], name='actionstat_user_action'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.action}: {self.count}"
@@ -0,0 +1,133 @@
+"""
+Delivery of the booking notifications queued in NotificationOutbox.
+
+Views only insert outbox rows inside their transaction; this module sends
+them afterwards (see the process_notifications management command). A row is
+claimed by pushing its next_attempt_at forward with a conditional UPDATE, so
+two workers (the long-running one and the cron safety net) never send the
+same row, and a row claimed by a worker that died becomes due again once the
+lease expires. Rows are leased one at a time, right before they are sent,
+so NOTIFICATION_LEASE_SECONDS only has to cover one delivery (SMTP plus the
+WHATSAPP_DEADLINE fan-out), and the final SENT/FAILED update only applies
+while the row is still held under that lease. Failed deliveries are retried
+with exponential backoff until NOTIFICATION_MAX_ATTEMPTS is reached, then
+marked FAILED.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .email_utils import decode_extra_context, deliver_booking_notification
+from .mail_delivery import EmailBatch
+from .models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+
+def _max_attempts():
+    return getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 8)
+
+
+def _lease_seconds():
+    return getattr(settings, 'NOTIFICATION_LEASE_SECONDS', 300)
+
+
+def retry_delay(attempts):
+    """Backoff before retry number `attempts` (1-based): base * 2^(attempts-1), capped"""
+    base = getattr(settings, 'NOTIFICATION_RETRY_BASE_SECONDS', 30)
+    cap = getattr(settings, 'NOTIFICATION_RETRY_MAX_SECONDS', 3600)
+    return timedelta(seconds=min(cap, base * 2 ** (attempts - 1)))
+
+
+def due_rows(batch_size=20):
+    """(id, next_attempt_at) of up to batch_size due PENDING rows, oldest first"""
+    return list(
+        NotificationOutbox.objects
+        .filter(status='PENDING', next_attempt_at__lte=timezone.now())
+        .order_by('next_attempt_at', 'id')
+        .values_list('id', 'next_attempt_at')[:batch_size]
+    )
+
+
+def claim(entry_id, next_attempt_at):
+    """
+    Lease one row to this worker right before sending it. Returns the entry
+    (its lease_until is the lease token) or None if another worker got it.
+    """
+    lease_until = timezone.now() + timedelta(seconds=_lease_seconds())
+    if not (NotificationOutbox.objects
+            .filter(id=entry_id, status='PENDING', next_attempt_at=next_attempt_at)
+            .update(next_attempt_at=lease_until)):
+        return None
+    entry = NotificationOutbox.objects.select_related('booking').get(id=entry_id)
+    entry.lease_until = lease_until
+    return entry
+
+
+def _leased(entry):
+    # Still ours: nobody re-claimed the row after our lease expired
+    return NotificationOutbox.objects.filter(pk=entry.pk, status='PENDING', next_attempt_at=entry.lease_until)
+
+
+def mark_sent(entry):
+    if not _leased(entry).update(status='SENT', sent_at=timezone.now(), last_error=''):
+        logger.warning(f"Notification {entry.pk} sent after its lease expired")
+
+
+def mark_failed(entry, error):
+    """Record a failed attempt and schedule the retry (or give up)"""
+    attempts = entry.attempts + 1
+    fields = {'attempts': attempts, 'last_error': str(error)[:2000]}
+    give_up = attempts >= _max_attempts()
+    if give_up:
+        fields['status'] = 'FAILED'
+    else:
+        fields['next_attempt_at'] = timezone.now() + retry_delay(attempts)
+    if not _leased(entry).update(**fields):
+        logger.warning(f"Notification {entry.pk} failed after its lease expired, left to its new owner")
+    elif give_up:
+        logger.error(f"Notification {entry.pk} failed permanently after {attempts} attempts: {error}")
+    else:
+        logger.warning(f"Notification {entry.pk} attempt {attempts} failed, retrying: {error}")
+
+
+def deliver_entry(entry, batch=None):
+    """Send one outbox row; raises on failure"""
+    return deliver_booking_notification(
+        entry.booking,
+        entry.action_type,
+        entry.recipient_family,
+        decode_extra_context(entry.extra_context),
+        batch=batch,
+    )
+
+
+def process_due(batch_size=20):
+    """Deliver one batch of due notifications. Returns (sent, failed)."""
+    sent = failed = 0
+    rows = due_rows(batch_size)
+    if not rows:
+        return sent, failed
+
+    # One SMTP session for the whole batch; each row is leased only when its
+    # turn comes, so a slow batch never outlives the lease of a waiting row
+    with EmailBatch() as batch:
+        for entry_id, next_attempt_at in rows:
+            entry = claim(entry_id, next_attempt_at)
+            if entry is None:
+                continue
+            started = time.monotonic()
+            try:
+                deliver_entry(entry, batch)
+            except Exception as e:
+                mark_failed(entry, e)
+                failed += 1
+            else:
+                mark_sent(entry)
+                sent += 1
+            # SMTP + CallMeBot time per notification (the worker's counterpart of Server-Timing)
+            logger.info(f"Notification {entry.pk} processed in {(time.monotonic() - started) * 1000:.0f} ms")
+    return sent, failed
@@ -0,0 +1,170 @@
+"""
+Per-request timing breakdown: SQL queries, template rendering and calls to
+Home Assistant (email and WhatsApp go through the outbox worker, which logs
+their duration instead).
+
+RequestTimingMiddleware (middleware.py) puts a RequestTimings in a context
+variable for the duration of each request. Everything below reports into it
+only when one is set, so the same code paths cost nothing in management
+commands and workers:
+
+- every database connection gets an execute_wrapper (installed from the
+  connection_created signal) counting queries and their duration, and for
+  /metrics/ at any time: the duration of write statements and BEGIN
+  (where SQLite waits for the writer lock), the writes slower than
+  SQLITE_LOCK_WAIT_THRESHOLD_MS (counted as lock waits) and the "database
+  is locked" errors;
+- the Django template backend render() is timed (includes are part of the
+  outer render, not counted twice);
+- external calls are wrapped in `with external_call('ha'):` blocks.
+
+install() is called once from BookingsConfig.ready().
+
+Context variables follow sync_to_async/async_to_sync hops and new asyncio
+tasks, so sync views run in a worker thread and async HA calls are counted.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import OperationalError
+from django.db.backends.signals import connection_created
+
+from .metrics import SQLITE_LOCK_ERRORS, SQLITE_LOCK_WAITS, SQLITE_WRITE_LATENCY
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self.template_depth = 0
+        self.external_ms = defaultdict(float)  # service -> ms
+        self._lock = threading.Lock()
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def add_query(self, ms):
+        with self._lock:
+            self.queries += 1
+            self.db_ms += ms
+
+    def add_external(self, service, ms):
+        with self._lock:
+            self.external_ms[service] += ms
+
+    def server_timing(self):
+        """Value of the Server-Timing header"""
+        metrics = [
+            f'db;dur={self.db_ms:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_ms:.1f}',
+        ]
+        metrics += [f'ext-{service};dur={ms:.1f}' for service, ms in sorted(self.external_ms.items())]
+        metrics.append(f'total;dur={self.total_ms:.1f}')
+        return ', '.join(metrics)
+
+
+def start():
+    """Begin collecting for the current request; returns (timings, reset token)"""
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def external_call(service):
+    """Time a call to an external service into the current request, if any"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_external(service, (time.perf_counter() - started) * 1000)
+
+
+WRITE_STATEMENTS = ('BEGIN', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def _query_timer(execute, sql, params, many, context):
+    timings = _current.get()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    except OperationalError as e:
+        # Raised once busy_timeout is over: the writer lock was never obtained
+        if 'database is locked' in str(e):
+            SQLITE_LOCK_ERRORS.inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        if timings is not None:
+            timings.add_query(elapsed * 1000)
+        # atomic() opens transactions with BEGIN IMMEDIATE (a bare write
+        # opens its own), which waits up to busy_timeout for the writer
+        # lock: a slow write statement is almost always that wait
+        if sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+            SQLITE_WRITE_LATENCY.observe(elapsed)
+            if elapsed * 1000 >= getattr(settings, 'SQLITE_LOCK_WAIT_THRESHOLD_MS', 100):
+                SQLITE_LOCK_WAITS.inc()
+
+
+def _install_query_timer(sender, connection, **kwargs):
+    # connection_created fires again on reconnects of the same wrapper
+    if _query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_query_timer)
+
+
+def _timed_render(render):
+    def wrapper(self, *args, **kwargs):
+        timings = _current.get()
+        if timings is None:
+            return render(self, *args, **kwargs)
+        timings.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            timings.template_depth -= 1
+            if timings.template_depth == 0:
+                timings.template_ms += (time.perf_counter() - started) * 1000
+    wrapper._request_timing = True
+    return wrapper
+
+
+_installed = False
+
+
+def install():
+    """Hook the database connections and the template backend (once per process)"""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    from django.db import connections
+    from django.template.backends.django import Template
+
+    connection_created.connect(_install_query_timer, dispatch_uid='request_timing_query_timer')
+    for connection in connections.all(initialized_only=True):
+        _install_query_timer(None, connection)
+
+    if not getattr(Template.render, '_request_timing', False):
+        Template.render = _timed_render(Template.render)
@@ -1,9 +1,12 @@
 """
-WebSocket URL routing for chat functionality.
+WebSocket URL routing for chat, notifications, calendar and thermostat updates.
 """
 from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/chat/$', consumers.ChatConsumer.as_asgi()),
+    re_path(r'ws/notifications/$', consumers.NotificationConsumer.as_asgi()),
+    re_path(r'ws/bookings/$', consumers.BookingEventsConsumer.as_asgi()),
+    re_path(r'ws/thermostat/$', consumers.ThermostatConsumer.as_asgi()),
 ]
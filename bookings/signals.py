@@ -0,0 +1,63 @@
+"""
+Model signal handlers keeping caches and aggregates in sync with the database.
+"""
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .booking_index import booking_index, interval_from_booking
+from .calendar_push import booking_change, push_booking_change
+from .models import Booking, BookingAudit
+from . import usage_stats
+from .versioning import bump_booking_version
+
+
+@receiver(pre_save, sender=Booking)
+def booking_pre_save(sender, instance, update_fields=None, **kwargs):
+    # Remember the stored row so post_save can apply the statistics delta
+    if update_fields is not None and not set(update_fields) & set(usage_stats.BookingSnapshot._fields):
+        instance._stats_snapshot = usage_stats.snapshot(instance)  # Tracked fields not written
+        return
+    if getattr(instance, '_stats_snapshot', None) is not None:
+        return  # Loaded from the database (Booking.from_db) or left by the previous save
+    old = None
+    if instance.pk:
+        old = Booking.objects.filter(pk=instance.pk).only(*usage_stats.BookingSnapshot._fields).first()
+    instance._stats_snapshot = usage_stats.snapshot(old) if old else None
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, **kwargs):
+    old = getattr(instance, '_stats_snapshot', None)
+    usage_stats.apply_booking_change(old, usage_stats.snapshot(instance))
+    instance._stats_snapshot = usage_stats.snapshot(instance)
+
+    # Applied once the write is committed (rolled back saves never reach the index)
+    version = bump_booking_version()
+    interval = interval_from_booking(instance)
+    transaction.on_commit(lambda: booking_index.apply(version, interval.id, interval))
+
+    diff = booking_change(old, instance)
+    if diff:
+        transaction.on_commit(lambda: push_booking_change(diff))
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    usage_stats.apply_booking_change(usage_stats.snapshot(instance), None)
+
+    booking_id = instance.id
+    version = bump_booking_version()
+    transaction.on_commit(lambda: booking_index.apply(version, booking_id))
+    transaction.on_commit(lambda: push_booking_change({'change': 'removed', 'id': booking_id, 'row': None}))
+
+
+@receiver(post_save, sender=BookingAudit)
+def audit_saved(sender, instance, created, **kwargs):
+    if created:
+        usage_stats.apply_action(instance.performed_by_id, instance.action, 1)
+
+
+@receiver(post_delete, sender=BookingAudit)
+def audit_deleted(sender, instance, **kwargs):
+    usage_stats.apply_action(instance.performed_by_id, instance.action, -1)
@@ -6,6 +6,8 @@ from . import views
 urlpatterns = [
     path('sw.js', TemplateView.as_view(template_name='sw.js', content_type='application/javascript'), name='service_worker'),
     path('', views.dashboard, name='dashboard'),
+    path('dashboard/audit-history/', views.audit_history_page, name='audit_history_page'),
+    path('dashboard/booking-history/', views.booking_history_page, name='booking_history_page'),
     path('calendar/', views.calendar_view, name='calendar'),
     path('statistics/', views.statistics_view, name='statistics'),
     path('chat/', views.chat_view, name='chat'),
@@ -0,0 +1,129 @@
+"""
+Incremental maintenance of the statistics aggregates (UsageStat, BridgeStat,
+ActionStat).
+
+Every booking save/delete subtracts the contribution of the previous row and
+adds the contribution of the new one, so the statistics page only reads a
+handful of small tables. rebuild_usage_stats() recomputes everything from
+scratch (see the rebuild_statistics management command).
+"""
+from collections import Counter, namedtuple
+
+from django.db import transaction
+from django.db.models import F
+
+from .coverage import DayCoverage, coverage_by_key
+from .holiday_calendar import get_bridge_days
+from .models import Booking, BookingAudit, UsageStat, BridgeStat, ActionStat
+
+# Only approved bookings count towards the statistics
+BookingSnapshot = namedtuple('BookingSnapshot', ['family_group', 'status', 'start_date', 'end_date'])
+
+
+def snapshot(booking):
+    return BookingSnapshot(booking.family_group, booking.status, booking.start_date, booking.end_date)
+
+
+def _usage_rows(family_group, coverage):
+    """{(family, year, month): (days, periods)} from a DayCoverage, month=0 being the whole year"""
+    usage = {
+        (family_group, year, month): value
+        for (year, month), value in coverage.per_month().items()
+    }
+    usage.update({
+        (family_group, year, 0): value
+        for year, value in coverage.per_year().items()
+    })
+    return usage
+
+
+def booking_contribution(snap):
+    """
+    Return (usage, bridges) for one booking:
+    usage[(family, year, month)] = (days, periods), bridges[(family, year, type)] = count
+    """
+    bridges = Counter()
+    if snap is None or snap.status != 'APPROVED':
+        return {}, bridges
+
+    usage = _usage_rows(snap.family_group, DayCoverage([(snap.start_date, snap.end_date)]))
+    for bridge in get_bridge_days(snap.start_date, snap.end_date):
+        bridges[(snap.family_group, bridge['date'].year, bridge['type'])] += 1
+    return usage, bridges
+
+
+def _bump(model, lookup, **deltas):
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    # Only additions create the row: a decrement of a missing row (e.g. its
+    # user is being deleted in the same cascade) must not bring it back
+    if model.objects.filter(**lookup).update(**updates) or all(delta < 0 for delta in deltas.values()):
+        return
+    model.objects.get_or_create(**lookup)
+    model.objects.filter(**lookup).update(**updates)
+
+
+def apply_booking_change(old, new):
+    """Apply the difference between two BookingSnapshots (either may be None)"""
+    old_usage, old_bridges = booking_contribution(old)
+    new_usage, new_bridges = booking_contribution(new)
+    if old_usage == new_usage and old_bridges == new_bridges:
+        return  # e.g. title change, or a non-approved booking
+
+    with transaction.atomic():
+        for key in set(old_usage) | set(new_usage):
+            old_days, old_periods = old_usage.get(key, (0, 0))
+            new_days, new_periods = new_usage.get(key, (0, 0))
+            family_group, year, month = key
+            _bump(UsageStat, {'family_group': family_group, 'year': year, 'month': month},
+                  days=new_days - old_days, periods=new_periods - old_periods)
+
+        for key in set(old_bridges) | set(new_bridges):
+            family_group, year, bridge_type = key
+            _bump(BridgeStat, {'family_group': family_group, 'year': year, 'bridge_type': bridge_type},
+                  count=new_bridges[key] - old_bridges[key])
+
+
+def apply_action(user_id, action, delta):
+    if user_id is None:
+        return
+    _bump(ActionStat, {'user_id': user_id, 'action': action}, count=delta)
+
+
+def rebuild_usage_stats():
+    """Recompute all the aggregates from Booking and BookingAudit"""
+    approved = Booking.objects.filter(status='APPROVED').values_list('family_group', 'start_date', 'end_date')
+    rows = list(approved.iterator())
+
+    # Days and periods for all months of all families in one batch per family
+    usage = {}
+    for family_group, coverage in coverage_by_key(rows).items():
+        usage.update(_usage_rows(family_group, coverage))
+
+    bridges = Counter()
+    for family_group, start, end in rows:
+        for bridge in get_bridge_days(start, end):
+            bridges[(family_group, bridge['date'].year, bridge['type'])] += 1
+
+    actions = Counter(
+        BookingAudit.objects.exclude(performed_by=None).values_list('performed_by_id', 'action').iterator()
+    )
+
+    with transaction.atomic():
+        UsageStat.objects.all().delete()
+        BridgeStat.objects.all().delete()
+        ActionStat.objects.all().delete()
+        UsageStat.objects.bulk_create(
+            UsageStat(family_group=f, year=y, month=m, days=days, periods=periods)
+            for (f, y, m), (days, periods) in usage.items()
+        )
+        BridgeStat.objects.bulk_create(
+            BridgeStat(family_group=f, year=y, bridge_type=t, count=count)
+            for (f, y, t), count in bridges.items()
+        )
+        ActionStat.objects.bulk_create(
+            ActionStat(user_id=user_id, action=action, count=count)
+            for (user_id, action), count in actions.items()
+        )
@@ -0,0 +1,72 @@
+"""
+Data-version stamps and ETags for the calendar JSON endpoints.
+
+The stamps change on every create, update and delete, whichever process
+made the write. Bookings have a DataVersion counter row, bumped by the
+signal handlers inside the write transaction; reading it is a primary key
+lookup. Ownership periods use a cheap aggregate.
+"""
+import hashlib
+from datetime import date
+
+import holidays
+from django.db import transaction
+from django.db.models import Count, F, Max
+
+from .models import DataVersion, OwnershipPeriod
+
+BOOKINGS_VERSION = 'bookings'
+
+
+def booking_version():
+    """Current value of the bookings write counter"""
+    return DataVersion.objects.filter(name=BOOKINGS_VERSION).values_list('version', flat=True).first() or 0
+
+
+def bump_booking_version():
+    """Increment the bookings counter (call inside the write transaction) and return the new value"""
+    # Bump and read back under the same write lock (a savepoint inside the caller's transaction)
+    with transaction.atomic():
+        if not DataVersion.objects.filter(name=BOOKINGS_VERSION).update(version=F('version') + 1):
+            DataVersion.objects.get_or_create(name=BOOKINGS_VERSION)
+            DataVersion.objects.filter(name=BOOKINGS_VERSION).update(version=F('version') + 1)
+        return booking_version()
+
+
+def booking_data_version():
+    return f"b{booking_version()}"
+
+
+def ownership_data_version():
+    # Periods are only ever created or deleted, never edited
+    agg = OwnershipPeriod.objects.aggregate(last=Max('id'), count=Count('id'))
+    return f"o{agg['count']}:{agg['last'] or 0}"
+
+
+def make_etag(*parts):
+    return hashlib.md5('|'.join(str(p) for p in parts).encode()).hexdigest()
+
+
+def booking_events_etag(request):
+    # The full payload colours events for the requesting family
+    return make_etag(
+        booking_data_version(),
+        request.user.profile.family_group,
+        request.GET.get('start', ''),
+        request.GET.get('end', ''),
+        request.GET.get('format', ''),
+    )
+
+
+def ownership_periods_etag(request):
+    return make_etag(ownership_data_version())
+
+
+def holiday_events_etag(request):
+    # Holidays only depend on the requested range and the holidays release
+    return make_etag(
+        holidays.__version__,
+        date.today().year,  # Default range when start/end are missing
+        request.GET.get('start', '')[:10],
+        request.GET.get('end', '')[:10],
+    )
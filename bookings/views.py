@@ -1,13 +1,39 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse, HttpResponseForbidden
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_POST, condition
+from django.views.decorators.cache import cache_control
+from django.utils import timezone
+from django.db import transaction
 from .models import Booking, UserProfile, BookingAudit
 from .forms import BookingForm, DerogaForm, RejectForm, UserProfileForm
-from .email_utils import send_booking_notification
+from .email_utils import queue_booking_notification
+from .calendar_push import BOOKING_EVENT_FIELDS, CALENDAR_STATUSES
+from .versioning import booking_events_etag, ownership_periods_etag, holiday_events_etag
 from datetime import timedelta, date
+from .holiday_calendar import holidays_for_years, get_bridge_days
+from .coverage import coverage_by_key, clip_range
 import json
-import holidays
+
+
+def overlap_error_response(conflicts, message):
+    """400 response for an overlap, listing the bookings that block the request"""
+    return JsonResponse({
+        'status': 'error',
+        'message': message,
+        'conflicts': [
+            {
+                'id': c.id,
+                'title': c.title,
+                'family_group': c.family_group,
+                'status': c.status,
+                'start_date': c.start_date.isoformat(),
+                'end_date': c.end_date.isoformat(),
+            }
+            for c in conflicts
+        ],
+    }, status=400)
+
 
 @login_required
 def dashboard(request):
@@ -17,13 +43,6 @@ def dashboard(request):
         # Handle case where user has no profile (shouldn't happen in prod but useful for debug)
         return render(request, 'bookings/no_profile.html')
 
-    # Subquery to get the approval date for each booking
-    from django.db.models import Subquery, OuterRef
-    approval_date_subquery = BookingAudit.objects.filter(
-        booking=OuterRef('pk'),
-        action='APPROVED'
-    ).order_by('-timestamp').values('timestamp')[:1]
-
     # 1. Deroga Requests received (status=DEROGA, pending_with=ME)
     deroga_requests = Booking.objects.filter(status='DEROGA', pending_with=user_group)
 
@@ -32,14 +51,7 @@ def dashboard(request):
     approved_bookings = Booking.objects.filter(
         status__in=['APPROVED', 'DEROGA'], 
         end_date__gte=cutoff_date
-    ).annotate(
-        approved_at=Subquery(approval_date_subquery)
     ).order_by('start_date')
-    
-    # All history for modal
-    all_history_bookings = Booking.objects.filter(status__in=['APPROVED', 'DEROGA']).annotate(
-        approved_at=Subquery(approval_date_subquery)
-    ).order_by('-start_date')
 
     # 3. Requires Attention (pending with ME, status=NEGOTIATION, but NOT created by MY family)
     # This shows requests from the OTHER family that need MY approval
@@ -54,12 +66,10 @@ def dashboard(request):
     my_requests = Booking.objects.filter(status='NEGOTIATION', family_group=user_group)
 
     # 5. History (Audit logs) - Last 30 entries (Card)
+    # The full log and booking history modals are loaded page by page (audit_history_page, booking_history_page)
     audit_history = BookingAudit.objects.select_related('booking', 'performed_by').order_by('-timestamp')[:30]
-    
-    # 6. All Audit Logs (Modal)
-    all_audit_history = BookingAudit.objects.select_related('booking', 'performed_by').order_by('-timestamp')
 
-    # 7. Ownership Periods (±3 months for card, all for modal)
+    # 6. Ownership Periods (±3 months for card, all for modal)
     from .models import OwnershipPeriod
     from dateutil.relativedelta import relativedelta
     
@@ -79,17 +89,75 @@ def dashboard(request):
     context = {
         'deroga_requests': deroga_requests,
         'approved_bookings': approved_bookings,
-        'all_history_bookings': all_history_bookings,
         'requires_attention': requires_attention,
         'my_requests': my_requests,
         'user_group': user_group,
         'audit_history': audit_history,
-        'all_audit_history': all_audit_history,
         'recent_ownership_periods': recent_ownership_periods,
         'all_ownership_periods': all_ownership_periods,
     }
     return render(request, 'bookings/dashboard.html', context)
 
+HISTORY_PAGE_SIZE = 30
+
+
+@login_required
+def audit_history_page(request):
+    """
+    One page of the full audit log for the dashboard modal (htmx fragment).
+    Keyset pagination on id, newest first: ?before=<id of the last entry shown>.
+    """
+    cursor = request.GET.get('before', '')
+    audits = BookingAudit.objects.select_related('booking', 'performed_by').order_by('-id')
+    if cursor.isdigit():
+        audits = audits.filter(id__lt=int(cursor))
+    page = list(audits[:HISTORY_PAGE_SIZE + 1])
+
+    next_cursor = page[HISTORY_PAGE_SIZE - 1].id if len(page) > HISTORY_PAGE_SIZE else None
+    return render(request, 'bookings/partials/audit_history_page.html', {
+        'audits': page[:HISTORY_PAGE_SIZE],
+        'cursor': cursor,
+        'next_cursor': next_cursor,
+    })
+
+
+@login_required
+def booking_history_page(request):
+    """
+    One page of approved bookings history for the dashboard modal (htmx fragment).
+    Keyset pagination on (start_date, id) descending: ?before=<YYYY-MM-DD>_<id>.
+    """
+    from datetime import datetime
+    from django.db.models import Q
+
+    bookings = Booking.objects.filter(status__in=['APPROVED', 'DEROGA']).order_by('-start_date', '-id')
+
+    cursor = request.GET.get('before', '')
+    try:
+        cursor_date, cursor_id = cursor.split('_')
+        cursor_date = datetime.strptime(cursor_date, '%Y-%m-%d').date()
+        cursor_id = int(cursor_id)
+    except ValueError:
+        cursor = ''
+    else:
+        bookings = bookings.filter(
+            Q(start_date__lt=cursor_date) | Q(start_date=cursor_date, id__lt=cursor_id)
+        )
+
+    page = list(bookings[:HISTORY_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(page) > HISTORY_PAGE_SIZE:
+        last = page[HISTORY_PAGE_SIZE - 1]
+        next_cursor = f"{last.start_date:%Y-%m-%d}_{last.id}"
+
+    return render(request, 'bookings/partials/booking_history_page.html', {
+        'bookings': page[:HISTORY_PAGE_SIZE],
+        'cursor': cursor,
+        'next_cursor': next_cursor,
+        'user_group': request.user.profile.family_group,
+    })
+
+
 @login_required
 def calendar_view(request):
     return render(request, 'bookings/calendar.html')
@@ -109,48 +177,82 @@ def chat_view(request):
 def unread_chat_count(request):
     """API endpoint to get unread chat message count"""
     from .models import ChatMessage
-    count = ChatMessage.objects.filter(is_read=False).exclude(sender=request.user).count()
-    return JsonResponse({'count': count})
+    return JsonResponse({'count': ChatMessage.unread_count_for(request.user)})
+
+def parse_calendar_range(request):
+    """
+    Parse the start/end window FullCalendar sends with every fetch
+    (e.g. '2026-06-29T00:00:00+02:00'). End is exclusive.
+    Returns (None, None) when the window is missing or malformed.
+    """
+    from datetime import datetime
+
+    try:
+        start = datetime.strptime(request.GET['start'][:10], '%Y-%m-%d').date()
+        end = datetime.strptime(request.GET['end'][:10], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        return None, None
+    return start, end
+
+
+def booking_event_color(status, family_group, user_group):
+    if status == 'APPROVED':
+        return 'green' if family_group == 'Andrea' else 'blue'
+    if status == 'NEGOTIATION':
+        # Yellow: My pending requests
+        # Orange: Other pending requests
+        return 'gold' if family_group == user_group else 'orange'
+    return 'gray'
+
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=booking_events_etag)
 def booking_events(request):
-    # Returns JSON for FullCalendar
-    bookings = Booking.objects.exclude(status='CANCELLED').exclude(status='REJECTED')
-    events = []
-    
-    user_group = request.user.profile.family_group
+    """
+    Returns JSON for FullCalendar.
+    When the visible window (start/end) is sent only the bookings touching it
+    are returned; ?format=compact returns positional rows instead of event
+    objects, colours and titles being derived client side.
+    """
+    bookings = Booking.objects.filter(status__in=CALENDAR_STATUSES)
 
-    for b in bookings:
-        color = 'gray'
-        if b.status == 'APPROVED':
-            if b.family_group == 'Andrea':
-                color = 'green'
-            else:
-                color = 'blue'
-        elif b.status == 'NEGOTIATION':
-            # Yellow: My pending requests
-            # Orange: Other pending requests
-            if b.family_group == user_group:
-                color = 'gold' # My requests
-            else:
-                color = 'orange' # Others requests
-        
+    range_start, range_end = parse_calendar_range(request)
+    if range_start:
+        # Booking end_date is inclusive, the window end is exclusive
+        bookings = bookings.filter(start_date__lt=range_end, end_date__gte=range_start)
+
+    rows = bookings.order_by('start_date').values_list(*BOOKING_EVENT_FIELDS)
+
+    if request.GET.get('format') == 'compact':
+        return JsonResponse({
+            'fields': BOOKING_EVENT_FIELDS,
+            'rows': [
+                [pk, title, family_group, status, pending_with, start.isoformat(), end.isoformat()]
+                for pk, title, family_group, status, pending_with, start, end in rows
+            ],
+        })
+
+    user_group = request.user.profile.family_group
+    events = []
+    for pk, title, family_group, status, pending_with, start, end in rows:
         events.append({
-            'id': b.id,
-            'title': f"{b.title} ({b.family_group})",
-            'start': b.start_date.isoformat(),
-            'end': (b.end_date + timedelta(days=1)).isoformat(),  # FullCalendar end is EXCLUSIVE (next day)
-            'color': color,
+            'id': pk,
+            'title': f"{title} ({family_group})",
+            'start': start.isoformat(),
+            'end': (end + timedelta(days=1)).isoformat(),  # FullCalendar end is EXCLUSIVE (next day)
+            'color': booking_event_color(status, family_group, user_group),
             'extendedProps': {
-                'status': b.status,
-                'pending_with': b.pending_with,
-                'family_group': b.family_group  # CRITICAL: needed for drag & drop permission checks
+                'status': status,
+                'pending_with': pending_with,
+                'family_group': family_group  # CRITICAL: needed for drag & drop permission checks
             }
         })
     return JsonResponse(events, safe=False)
 
 @login_required
 @require_POST
+@transaction.atomic
 def create_booking(request):
     from .models import OwnershipPeriod
     
@@ -162,13 +264,15 @@ def create_booking(request):
         
         # Check constraints (Server side overlap check)
         # Smart overlap check allowing touching dates
-        if Booking.check_overlap(booking.start_date, booking.end_date):
-             return JsonResponse({'status': 'error', 'message': 'Date sovrapposte a una prenotazione approvata!'}, status=400)
+        conflicts = Booking.find_overlaps(booking.start_date, booking.end_date)
+        if conflicts:
+            return overlap_error_response(conflicts, 'Date sovrapposte a una prenotazione approvata!')
 
         # Check if booking is within an ownership period (auto-approve)
         if OwnershipPeriod.is_within_ownership(booking.family_group, booking.start_date, booking.end_date):
             booking.status = 'APPROVED'
             booking.pending_with = None
+            booking.approved_at = timezone.now()
             booking.save()
             booking.log_action('AUTO_APPROVED', request.user, details='Periodo di pertinenza')
             return JsonResponse({'status': 'ok', 'message': 'Prenotazione auto-approvata (periodo di pertinenza).'})
@@ -177,27 +281,29 @@ def create_booking(request):
             booking.pending_with = booking.get_other_group()
             booking.save()
             booking.log_action('CREATED', request.user)
-            # Send email notification to the other family
-            send_booking_notification(booking, 'created')
+            # Queue email notification to the other family
+            queue_booking_notification(booking, 'created')
             return JsonResponse({'status': 'ok'})
     else:
         return JsonResponse({'status': 'error', 'errors': form.errors}, status=400)
 
 @login_required
 @require_POST
+@transaction.atomic
 def approve_booking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
     if booking.pending_with != request.user.profile.family_group:
         return HttpResponseForbidden("Non tocca a te approvare.")
     
     booking.approve(request.user)
-    # Send confirmation email to the booking owner
-    send_booking_notification(booking, 'approved')
+    # Queue confirmation email to the booking owner
+    queue_booking_notification(booking, 'approved')
     return JsonResponse({'status': 'ok'})
 
 
 @login_required
 @require_POST
+@transaction.atomic
 def reject_booking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
     if booking.pending_with != request.user.profile.family_group:
@@ -205,13 +311,14 @@ def reject_booking(request, booking_id):
     
     note = request.POST.get('note', '')
     booking.reject(request.user, note)
-    # Send email notification if pending back with owner
+    # Queue email notification if pending back with owner
     if booking.pending_with == booking.family_group:
-        send_booking_notification(booking, 'rejected', {'rejection_note': note})
+        queue_booking_notification(booking, 'rejected', {'rejection_note': note})
     return JsonResponse({'status': 'ok'})
 
 @login_required
 @require_POST
+@transaction.atomic
 def request_deroga_view(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
     # Only if approved
@@ -224,14 +331,15 @@ def request_deroga_view(request, booking_id):
         new_end = form.cleaned_data['new_end_date']
         note = form.cleaned_data['note']
         booking.request_deroga(request.user, new_start, new_end, note)
-        # Send urgent email notification to the owner
-        send_booking_notification(booking, 'deroga_requested', {'deroga_note': note})
+        # Queue urgent email notification to the owner
+        queue_booking_notification(booking, 'deroga_requested', {'deroga_note': note})
         return JsonResponse({'status': 'ok'})
     else:
         return JsonResponse({'status': 'error', 'errors': form.errors}, status=400)
 
 @login_required
 @require_POST
+@transaction.atomic
 def modify_booking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
     if booking.user != request.user:
@@ -243,17 +351,19 @@ def modify_booking(request, booking_id):
         end = form.cleaned_data['end_date']
         
         # Check overlaps (excluding self)
-        if Booking.check_overlap(start, end, exclude_id=booking.id):
-             return JsonResponse({'status': 'error', 'message': 'Date sovrapposte a una prenotazione approvata!'}, status=400)
+        conflicts = Booking.find_overlaps(start, end, exclude_id=booking.id)
+        if conflicts:
+            return overlap_error_response(conflicts, 'Date sovrapposte a una prenotazione approvata!')
 
         booking.modify(request.user, start, end)
-        # Send email notification to the other family for re-approval
-        send_booking_notification(booking, 'modified')
+        # Queue email notification to the other family for re-approval
+        queue_booking_notification(booking, 'modified')
         return JsonResponse({'status': 'ok'})
     return JsonResponse({'status': 'error', 'errors': form.errors}, status=400)
 
 @login_required
 @require_POST
+@transaction.atomic
 def delete_booking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
     # Only owner can delete
@@ -265,6 +375,7 @@ def delete_booking(request, booking_id):
 
 @login_required
 @require_POST
+@transaction.atomic
 def update_booking_dates(request, booking_id):
     """Handle drag & drop updates from calendar with smart approval logic"""
     from datetime import datetime
@@ -291,8 +402,9 @@ def update_booking_dates(request, booking_id):
     original_status = booking.status
     
     # Check for overlaps with other approved bookings (excluding this one)
-    if Booking.check_overlap(new_start, new_end, exclude_id=booking_id):
-        return JsonResponse({'status': 'error', 'message': 'Sovrapposizione con altra prenotazione approvata'}, status=400)
+    conflicts = Booking.find_overlaps(new_start, new_end, exclude_id=booking.id)
+    if conflicts:
+        return overlap_error_response(conflicts, 'Sovrapposizione con altra prenotazione approvata')
     
     # Apply smart approval logic for APPROVED bookings
     if original_status == 'APPROVED':
@@ -306,7 +418,7 @@ def update_booking_dates(request, booking_id):
             booking.log_action('PERIOD_REDUCED', request.user, 
                              f"Periodo ridotto da {original_start} - {original_end} a {new_start} - {new_end}")
             booking.save()
-            send_booking_notification(booking, 'period_reduced', {
+            queue_booking_notification(booking, 'period_reduced', {
                 'original_start': original_start,
                 'original_end': original_end
             })
@@ -320,7 +432,7 @@ def update_booking_dates(request, booking_id):
             booking.log_action('PERIOD_EXTENDED', request.user,
                              f"Periodo modificato da {original_start} - {original_end} a {new_start} - {new_end}, richiede nuova approvazione")
             booking.save()
-            send_booking_notification(booking, 'modified')
+            queue_booking_notification(booking, 'modified')
             return JsonResponse({'status': 'ok', 'message': 'Periodo esteso. Richiesta nuova approvazione dall\'altra famiglia.'})
     
     # For NEGOTIATION status, just update dates
@@ -330,12 +442,14 @@ def update_booking_dates(request, booking_id):
         booking.log_action('DATES_UPDATED', request.user,
                          f"Date aggiornate da {original_start} - {original_end} a {new_start} - {new_end}")
         booking.save()
-        send_booking_notification(booking, 'modified')
+        queue_booking_notification(booking, 'modified')
         return JsonResponse({'status': 'ok', 'message': 'Date aggiornate. L\'altra famiglia è stata notificata.'})
     
     return JsonResponse({'status': 'error', 'message': 'Stato non valido per modifica drag & drop'}, status=400)
 
 
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=holiday_events_etag)
 def holiday_events(request):
     """Return Italian holidays for the calendar as background events"""
     # Get year range from request params (FullCalendar sends start/end)
@@ -356,15 +470,12 @@ def holiday_events(request):
     except (ValueError, IndexError):
         start_year = end_year = date.today().year
     
-    # Get Italian holidays for the year range
-    it_holidays = holidays.Italy(years=range(start_year, end_year + 1))
-    
     events = []
-    for holiday_date, holiday_name in sorted(it_holidays.items()):
+    for holiday in holidays_for_years(start_year, end_year):
         events.append({
-            'title': holiday_name,
-            'start': holiday_date.isoformat(),
-            'end': holiday_date.isoformat(),
+            'title': holiday.name,
+            'start': holiday.date.isoformat(),
+            'end': holiday.date.isoformat(),
             'display': 'background',  # Show as background event
             'color': '#ffcccc',  # Light red background
             'textColor': '#990000',
@@ -377,151 +488,82 @@ def holiday_events(request):
     return JsonResponse(events, safe=False)
 
 
-def get_bridge_days_in_booking(start_date, end_date, it_holidays):
+def latest_bridge_details(approved_bookings, limit=10):
     """
-    Identify bridge days (ponti) within a booking period.
-    A "ponte" is a holiday that falls on:
-    - Monday (ponte with preceding weekend)
-    - Tuesday (super-ponte if Monday is taken off)
-    - Thursday (ponte if Friday is taken off)  
-    - Friday (ponte with following weekend)
-    Returns a list of (holiday_date, holiday_name, bridge_type)
+    Most recent bridge days inside the given approved bookings.
+    Walks bookings by descending end date and stops as soon as no older
+    booking can contain a bridge more recent than the ones collected.
     """
-    bridge_days = []
-    current = start_date
-    while current <= end_date:
-        if current in it_holidays:
-            weekday = current.weekday()  # 0=Monday, 6=Sunday
-            bridge_type = None
-            
-            if weekday == 0:  # Monday - ponte with weekend before
-                bridge_type = "Ponte Lunedì"
-            elif weekday == 1:  # Tuesday - super-ponte
-                bridge_type = "Super-Ponte Martedì"
-            elif weekday == 3:  # Thursday - ponte with potential Friday off
-                bridge_type = "Ponte Giovedì"
-            elif weekday == 4:  # Friday - ponte with weekend after
-                bridge_type = "Ponte Venerdì"
-            
-            if bridge_type:
-                bridge_days.append({
-                    'date': current,
-                    'name': it_holidays[current],
-                    'type': bridge_type
-                })
-        
-        current += timedelta(days=1)
-    
-    return bridge_days
+    details = []
+    for b in approved_bookings.order_by('-end_date').only('title', 'start_date', 'end_date').iterator(chunk_size=20):
+        if len(details) >= limit and b.end_date < details[limit - 1]['date']:
+            break
+        for bridge in get_bridge_days(b.start_date, b.end_date):
+            bridge['booking_title'] = b.title
+            details.append(bridge)
+        details.sort(key=lambda x: x['date'], reverse=True)
+    return details[:limit]
 
 
 @login_required
 def statistics_view(request):
-    """Comprehensive statistics page for bookings"""
-    from django.db.models import Count, Sum, Avg, Max, Min, Q
-    from django.db.models.functions import ExtractYear
+    """
+    Comprehensive statistics page for bookings.
+    Days, bridges and action counts come from the materialised aggregates
+    (UsageStat, BridgeStat, ActionStat) kept up to date by usage_stats.py.
+    """
+    from django.db.models import Count, Sum, Max, Q, F, ExpressionWrapper, DurationField
     from collections import defaultdict
+    from .models import UsageStat, BridgeStat, ActionStat
     
     user = request.user
     user_group = user.profile.family_group
     family_groups = [choice[0] for choice in Booking.FAMILY_CHOICES]
     other_group = next((group for group in family_groups if group != user_group), None)
     current_year = date.today().year
-    year_start = date(current_year, 1, 1)
-    year_end = date(current_year, 12, 31)
-
-    def iter_date_range(start, end):
-        current = start
-        while current <= end:
-            yield current
-            current += timedelta(days=1)
-
-    def overlap_days(start, end, range_start, range_end):
-        overlap_start = max(start, range_start)
-        overlap_end = min(end, range_end)
-        if overlap_start > overlap_end:
-            return 0
-        return (overlap_end - overlap_start).days + 1
-    
-    # Get all years with bookings for bridge calculation
-    all_approved = Booking.objects.filter(status='APPROVED')
-    years_with_bookings = set()
-    for b in all_approved:
-        years_with_bookings.add(b.start_date.year)
-        years_with_bookings.add(b.end_date.year)
-    years_with_bookings.add(current_year)
-    
-    # Load Italian holidays for all relevant years
-    it_holidays = holidays.Italy(years=list(years_with_bookings) if years_with_bookings else [current_year])
-    
+
+    # Per-family booking counters and longest period, one query
+    span = ExpressionWrapper(F('end_date') - F('start_date'), output_field=DurationField())
+    booking_stats = {
+        row['family_group']: row
+        for row in Booking.objects.filter(family_group__in=[user_group, other_group]).values('family_group').annotate(
+            approved=Count('id', filter=Q(status='APPROVED')),
+            pending=Count('id', filter=Q(status='NEGOTIATION')),
+            max_span=Max(span, filter=Q(status='APPROVED')),
+        )
+    }
+
+    def family_booking_stats(group):
+        row = booking_stats.get(group, {})
+        max_span = row.get('max_span')
+        return row.get('approved', 0), row.get('pending', 0), (max_span.days + 1 if max_span is not None else 0)
+
+    # Yearly rows (month=0) for both families
+    yearly = defaultdict(dict)
+    for row in UsageStat.objects.filter(family_group__in=[user_group, other_group], month=0, days__gt=0):
+        yearly[row.family_group][row.year] = {'count': row.periods, 'days': row.days}
+
+    # Bridges per family, year and type
+    bridges_by_year = defaultdict(lambda: defaultdict(int))
+    bridges_by_type = defaultdict(lambda: defaultdict(int))
+    for row in BridgeStat.objects.filter(family_group__in=[user_group, other_group], count__gt=0):
+        bridges_by_year[row.family_group][row.year] += row.count
+        bridges_by_type[row.family_group][row.bridge_type] += row.count
+
     # ========== MY BOOKINGS STATS ==========
     my_bookings = Booking.objects.filter(family_group=user_group).exclude(status='CANCELLED')
     my_approved = my_bookings.filter(status='APPROVED')
-    
-    # Calculate days per booking and bridge days
-    my_total_days = 0
-    my_max_period = 0
-    my_periods_by_year = defaultdict(lambda: {'count': 0, 'days': 0})
-    
-    # Bridge (Ponte) statistics
-    my_total_bridges = 0
-    my_bridge_details = []  # List of all bridge days in my bookings
-    my_bridges_by_year = defaultdict(lambda: {'count': 0, 'bridges': []})
-    my_bridges_by_type = defaultdict(int)  # Count by bridge type
-    
-    for b in my_approved:
-        days = (b.end_date - b.start_date).days + 1
-        my_total_days += days
-        my_max_period = max(my_max_period, days)
-        booking_start_year = b.start_date.year
-        booking_end_year = b.end_date.year
-        for year in range(booking_start_year, booking_end_year + 1):
-            year_range_start = date(year, 1, 1)
-            year_range_end = date(year, 12, 31)
-            year_days = overlap_days(b.start_date, b.end_date, year_range_start, year_range_end)
-            if year_days > 0:
-                my_periods_by_year[year]['count'] += 1
-                my_periods_by_year[year]['days'] += year_days
-        
-        # Calculate bridges in this booking
-        bridges = get_bridge_days_in_booking(b.start_date, b.end_date, it_holidays)
-        my_total_bridges += len(bridges)
-        for bridge in bridges:
-            bridge['booking_title'] = b.title
-            my_bridge_details.append(bridge)
-            bridge_year = bridge['date'].year  # Use the bridge's actual year, not booking start year
-            my_bridges_by_year[bridge_year]['count'] += 1
-            my_bridges_by_year[bridge_year]['bridges'].append(bridge)
-            my_bridges_by_type[bridge['type']] += 1
-    
-    my_avg_period = my_total_days / my_approved.count() if my_approved.count() > 0 else 0
+    my_total_periods, my_pending, my_max_period = family_booking_stats(user_group)
+    my_periods_by_year = yearly[user_group]
+    my_total_days = sum(data['days'] for data in my_periods_by_year.values())
+    my_avg_period = my_total_days / my_total_periods if my_total_periods > 0 else 0
+    my_total_bridges = sum(bridges_by_year[user_group].values())
     
     # ========== OTHER FAMILY STATS ==========
-    other_bookings = Booking.objects.filter(family_group=other_group).exclude(status='CANCELLED')
-    other_approved = other_bookings.filter(status='APPROVED')
-    
-    other_total_days = 0
-    other_max_period = 0
-    other_total_bridges = 0
-    other_bridge_details = []
-    other_bridges_by_year = defaultdict(lambda: {'count': 0, 'bridges': []})
-    other_bridges_by_type = defaultdict(int)
-    
-    for b in other_approved:
-        days = (b.end_date - b.start_date).days + 1
-        other_total_days += days
-        other_max_period = max(other_max_period, days)
-        
-        # Calculate bridges in this booking
-        bridges = get_bridge_days_in_booking(b.start_date, b.end_date, it_holidays)
-        other_total_bridges += len(bridges)
-        for bridge in bridges:
-            bridge['booking_title'] = b.title
-            other_bridge_details.append(bridge)
-            bridge_year = bridge['date'].year  # Use the bridge's actual year, not booking start year
-            other_bridges_by_year[bridge_year]['count'] += 1
-            other_bridges_by_year[bridge_year]['bridges'].append(bridge)
-            other_bridges_by_type[bridge['type']] += 1
+    other_approved = Booking.objects.filter(family_group=other_group, status='APPROVED')
+    other_total_periods, _, other_max_period = family_booking_stats(other_group)
+    other_total_days = sum(data['days'] for data in yearly[other_group].values())
+    other_total_bridges = sum(bridges_by_year[other_group].values())
     
     # ========== BRIDGE COMPARISON ==========
     total_bridges = my_total_bridges + other_total_bridges
@@ -529,30 +571,16 @@ def statistics_view(request):
     other_bridge_percentage = round(100 - my_bridge_percentage, 1) if total_bridges > 0 else 0
     
     # Current year bridges
-    my_current_year_bridges = my_bridges_by_year.get(current_year, {'count': 0})['count']
-    other_current_year_bridges = other_bridges_by_year.get(current_year, {'count': 0})['count']
+    my_current_year_bridges = bridges_by_year[user_group].get(current_year, 0)
+    other_current_year_bridges = bridges_by_year[other_group].get(current_year, 0)
     
     # ========== ACTION STATS FROM AUDIT ==========
-    my_audits = BookingAudit.objects.filter(performed_by=user)
-    
-    # Actions I performed
-    my_approvals = my_audits.filter(action='APPROVED').count()
-    my_rejections = my_audits.filter(action='REJECTED').count()
-    my_deroga_requests = my_audits.filter(action='DEROGA_REQUESTED').count()
-    my_creations = my_audits.filter(action='CREATED').count()
-    my_modifications = my_audits.filter(action__in=['MODIFIED', 'DATES_UPDATED', 'PERIOD_REDUCED', 'PERIOD_EXTENDED']).count()
-    my_cancellations = my_audits.filter(action='CANCELLED').count()
-    
-    # Deroga stats
-    deroga_accepted = my_audits.filter(action='DEROGA_ACCEPTED').count()
-    deroga_rejected = my_audits.filter(action='DEROGA_REJECTED').count()
+    my_actions = defaultdict(int, ActionStat.objects.filter(user=user).values_list('action', 'count'))
     
     # ========== CURRENT YEAR STATS ==========
-    my_current_year = my_approved.filter(end_date__gte=year_start, start_date__lte=year_end)
-    my_current_year_days = sum(overlap_days(b.start_date, b.end_date, year_start, year_end) for b in my_current_year)
-    
-    other_current_year = other_approved.filter(end_date__gte=year_start, start_date__lte=year_end)
-    other_current_year_days = sum(overlap_days(b.start_date, b.end_date, year_start, year_end) for b in other_current_year)
+    empty_year = {'count': 0, 'days': 0}
+    my_current_year = my_periods_by_year.get(current_year, empty_year)
+    other_current_year = yearly[other_group].get(current_year, empty_year)
     
     # ========== UPCOMING BOOKINGS ==========
     today = date.today()
@@ -561,10 +589,10 @@ def statistics_view(request):
     days_to_next = (next_booking.start_date - today).days if next_booking else None
     
     # ========== MONTHLY DISTRIBUTION ==========
-    monthly_distribution = defaultdict(int)
-    for b in my_approved:
-        for day in iter_date_range(b.start_date, b.end_date):
-            monthly_distribution[day.month] += 1
+    monthly_distribution = dict(
+        UsageStat.objects.filter(family_group=user_group, month__gt=0)
+        .values('month').annotate(total=Sum('days')).values_list('month', 'total')
+    )
     
     month_names = ['Gen', 'Feb', 'Mar', 'Apr', 'Mag', 'Giu', 'Lug', 'Ago', 'Set', 'Ott', 'Nov', 'Dic']
     monthly_data = [monthly_distribution.get(i, 0) for i in range(1, 13)]
@@ -584,32 +612,32 @@ def statistics_view(request):
         'current_year': current_year,
         
         # My stats
-        'my_total_periods': my_approved.count(),
+        'my_total_periods': my_total_periods,
         'my_total_days': my_total_days,
         'my_max_period': my_max_period,
         'my_avg_period': round(my_avg_period, 1),
-        'my_pending': my_bookings.filter(status='NEGOTIATION').count(),
+        'my_pending': my_pending,
         
         # Other family stats
-        'other_total_periods': other_approved.count(),
+        'other_total_periods': other_total_periods,
         'other_total_days': other_total_days,
         'other_max_period': other_max_period,
         
         # Action stats
-        'my_approvals': my_approvals,
-        'my_rejections': my_rejections,
-        'my_deroga_requests': my_deroga_requests,
-        'my_creations': my_creations,
-        'my_modifications': my_modifications,
-        'my_cancellations': my_cancellations,
-        'deroga_accepted': deroga_accepted,
-        'deroga_rejected': deroga_rejected,
+        'my_approvals': my_actions['APPROVED'],
+        'my_rejections': my_actions['REJECTED'],
+        'my_deroga_requests': my_actions['DEROGA_REQUESTED'],
+        'my_creations': my_actions['CREATED'],
+        'my_modifications': sum(my_actions[a] for a in ['MODIFIED', 'DATES_UPDATED', 'PERIOD_REDUCED', 'PERIOD_EXTENDED']),
+        'my_cancellations': my_actions['CANCELLED'],
+        'deroga_accepted': my_actions['DEROGA_ACCEPTED'],
+        'deroga_rejected': my_actions['DEROGA_REJECTED'],
         
         # Current year
-        'my_current_year_days': my_current_year_days,
-        'my_current_year_periods': my_current_year.count(),
-        'other_current_year_days': other_current_year_days,
-        'other_current_year_periods': other_current_year.count(),
+        'my_current_year_days': my_current_year['days'],
+        'my_current_year_periods': my_current_year['count'],
+        'other_current_year_days': other_current_year['days'],
+        'other_current_year_periods': other_current_year['count'],
         
         # Upcoming
         'next_booking': next_booking,
@@ -624,8 +652,8 @@ def statistics_view(request):
         'month_names': month_names,
         'monthly_data': monthly_data,
         
-    # Yearly breakdown
-    'my_periods_by_year': dict(sorted(my_periods_by_year.items(), reverse=True)),
+        # Yearly breakdown
+        'my_periods_by_year': dict(sorted(my_periods_by_year.items(), reverse=True)),
         
         # Bridge (Ponte) statistics
         'my_total_bridges': my_total_bridges,
@@ -634,10 +662,10 @@ def statistics_view(request):
         'other_bridge_percentage': other_bridge_percentage,
         'my_current_year_bridges': my_current_year_bridges,
         'other_current_year_bridges': other_current_year_bridges,
-        'my_bridges_by_type': dict(my_bridges_by_type),
-        'other_bridges_by_type': dict(other_bridges_by_type),
-        'my_bridge_details': sorted(my_bridge_details, key=lambda x: x['date'], reverse=True)[:10],  # Last 10
-        'other_bridge_details': sorted(other_bridge_details, key=lambda x: x['date'], reverse=True)[:10],
+        'my_bridges_by_type': dict(bridges_by_type[user_group]),
+        'other_bridges_by_type': dict(bridges_by_type[other_group]),
+        'my_bridge_details': latest_bridge_details(my_approved),  # Last 10
+        'other_bridge_details': latest_bridge_details(other_approved),
     }
     
     return render(request, 'bookings/statistics.html', context)
@@ -709,55 +737,38 @@ def utilities_view(request):
 # ============================================================
 # Home Assistant Integration
 # ============================================================
-import requests
-from django.conf import settings
+import httpx
+from .ha_client import (
+    ha_client, climate_entity, select_entity, thermostat_payload, schedule_payload,
+    HomeAssistantUnavailable, HA_NOT_CONFIGURED, HA_UNAVAILABLE,
+)
+from .ha_poller import ha_poller
+
+# The thermostat views are async: while Home Assistant is slow they wait on
+# the event loop instead of holding a thread of the sync view pool.
+
 
 @login_required
-def get_thermostat_status(request):
+async def get_thermostat_status(request):
     """Get current thermostat status from Home Assistant"""
-    ha_url = getattr(settings, 'HA_URL', '')
-    ha_token = getattr(settings, 'HA_TOKEN', '')
-    entity_id = getattr(settings, 'HA_CLIMATE_ENTITY', 'climate.salotto')
-    
-    if not ha_url or not ha_token:
-        return JsonResponse({'error': 'Home Assistant non configurato'}, status=500)
+    if not ha_client.configured:
+        return JsonResponse({'error': HA_NOT_CONFIGURED}, status=500)
     
     try:
-        headers = {
-            'Authorization': f'Bearer {ha_token}',
-            'Content-Type': 'application/json',
-        }
-        response = requests.get(
-            f'{ha_url}/api/states/{entity_id}',
-            headers=headers,
-            timeout=10
-        )
-        response.raise_for_status()
-        data = response.json()
-        
-        return JsonResponse({
-            'state': data.get('state'),
-            'current_temperature': data.get('attributes', {}).get('current_temperature'),
-            'target_temperature': data.get('attributes', {}).get('temperature'),
-            'hvac_action': data.get('attributes', {}).get('hvac_action'),
-            'preset_mode': data.get('attributes', {}).get('preset_mode'),
-            'min_temp': data.get('attributes', {}).get('min_temp', 7),
-            'max_temp': data.get('attributes', {}).get('max_temp', 30),
-        })
-    except requests.exceptions.RequestException as e:
+        data, age_seconds = await ha_client.get_state(climate_entity())
+        return JsonResponse(thermostat_payload(data, age_seconds))
+    except HomeAssistantUnavailable:
+        return JsonResponse({'error': HA_UNAVAILABLE}, status=503)
+    except httpx.HTTPError as e:
         return JsonResponse({'error': f'Errore connessione HA: {str(e)}'}, status=500)
 
 
 @login_required
 @require_POST
-def set_thermostat_temp(request):
+async def set_thermostat_temp(request):
     """Set thermostat target temperature via Home Assistant"""
-    ha_url = getattr(settings, 'HA_URL', '')
-    ha_token = getattr(settings, 'HA_TOKEN', '')
-    entity_id = getattr(settings, 'HA_CLIMATE_ENTITY', 'climate.salotto')
-    
-    if not ha_url or not ha_token:
-        return JsonResponse({'error': 'Home Assistant non configurato'}, status=500)
+    if not ha_client.configured:
+        return JsonResponse({'error': HA_NOT_CONFIGURED}, status=500)
     
     try:
         data = json.loads(request.body)
@@ -766,133 +777,85 @@ def set_thermostat_temp(request):
         if temperature < 5 or temperature > 35:
             return JsonResponse({'error': 'Temperatura fuori range (5-35°C)'}, status=400)
         
-        headers = {
-            'Authorization': f'Bearer {ha_token}',
-            'Content-Type': 'application/json',
-        }
-        
-        response = requests.post(
-            f'{ha_url}/api/services/climate/set_temperature',
-            headers=headers,
-            json={
-                'entity_id': entity_id,
-                'temperature': temperature
-            },
-            timeout=10
-        )
-        response.raise_for_status()
+        await ha_client.call_service('climate', 'set_temperature', {
+            'entity_id': climate_entity(),
+            'temperature': temperature
+        })
+        ha_poller.wake()
         
         return JsonResponse({'success': True, 'temperature': temperature})
     except (json.JSONDecodeError, ValueError, TypeError) as e:
         return JsonResponse({'error': f'Dati non validi: {str(e)}'}, status=400)
-    except requests.exceptions.RequestException as e:
+    except HomeAssistantUnavailable:
+        return JsonResponse({'error': HA_UNAVAILABLE}, status=503)
+    except httpx.HTTPError as e:
         return JsonResponse({'error': f'Errore connessione HA: {str(e)}'}, status=500)
 
 
 @login_required
 @require_POST
-def set_thermostat_preset(request):
+async def set_thermostat_preset(request):
     """Set thermostat preset mode (away, home, etc.)"""
-    ha_url = getattr(settings, 'HA_URL', '')
-    ha_token = getattr(settings, 'HA_TOKEN', '')
-    entity_id = getattr(settings, 'HA_CLIMATE_ENTITY', 'climate.salotto')
-    
-    if not ha_url or not ha_token:
-        return JsonResponse({'error': 'Home Assistant non configurato'}, status=500)
+    if not ha_client.configured:
+        return JsonResponse({'error': HA_NOT_CONFIGURED}, status=500)
     
     try:
         data = json.loads(request.body)
         preset = data.get('preset')
         
-        headers = {
-            'Authorization': f'Bearer {ha_token}',
-            'Content-Type': 'application/json',
-        }
-        
-        response = requests.post(
-            f'{ha_url}/api/services/climate/set_preset_mode',
-            headers=headers,
-            json={
-                'entity_id': entity_id,
-                'preset_mode': preset
-            },
-            timeout=10
-        )
-        response.raise_for_status()
+        await ha_client.call_service('climate', 'set_preset_mode', {
+            'entity_id': climate_entity(),
+            'preset_mode': preset
+        })
+        ha_poller.wake()
         
         return JsonResponse({'success': True, 'preset': preset})
     except (json.JSONDecodeError, ValueError, TypeError) as e:
         return JsonResponse({'error': f'Dati non validi: {str(e)}'}, status=400)
-    except requests.exceptions.RequestException as e:
+    except HomeAssistantUnavailable:
+        return JsonResponse({'error': HA_UNAVAILABLE}, status=503)
+    except httpx.HTTPError as e:
         return JsonResponse({'error': f'Errore connessione HA: {str(e)}'}, status=500)
 
 
 @login_required
-def get_schedule_options(request):
+async def get_schedule_options(request):
     """Get available schedule options from select entity"""
-    ha_url = getattr(settings, 'HA_URL', '')
-    ha_token = getattr(settings, 'HA_TOKEN', '')
-    select_entity = getattr(settings, 'HA_SELECT_ENTITY', 'select.pinzolo')
-    
-    if not ha_url or not ha_token:
-        return JsonResponse({'error': 'Home Assistant non configurato'}, status=500)
+    if not ha_client.configured:
+        return JsonResponse({'error': HA_NOT_CONFIGURED}, status=500)
     
     try:
-        headers = {
-            'Authorization': f'Bearer {ha_token}',
-            'Content-Type': 'application/json',
-        }
-        response = requests.get(
-            f'{ha_url}/api/states/{select_entity}',
-            headers=headers,
-            timeout=10
-        )
-        response.raise_for_status()
-        data = response.json()
-        
-        return JsonResponse({
-            'current': data.get('state'),
-            'options': data.get('attributes', {}).get('options', []),
-        })
-    except requests.exceptions.RequestException as e:
+        data, age_seconds = await ha_client.get_state(select_entity())
+        return JsonResponse(schedule_payload(data, age_seconds))
+    except HomeAssistantUnavailable:
+        return JsonResponse({'error': HA_UNAVAILABLE}, status=503)
+    except httpx.HTTPError as e:
         return JsonResponse({'error': f'Errore connessione HA: {str(e)}'}, status=500)
 
 
 @login_required
 @require_POST
-def set_schedule(request):
+async def set_schedule(request):
     """Set schedule via select entity"""
-    ha_url = getattr(settings, 'HA_URL', '')
-    ha_token = getattr(settings, 'HA_TOKEN', '')
-    select_entity = getattr(settings, 'HA_SELECT_ENTITY', 'select.pinzolo')
-    
-    if not ha_url or not ha_token:
-        return JsonResponse({'error': 'Home Assistant non configurato'}, status=500)
+    if not ha_client.configured:
+        return JsonResponse({'error': HA_NOT_CONFIGURED}, status=500)
     
     try:
         data = json.loads(request.body)
         schedule = data.get('schedule')
         
-        headers = {
-            'Authorization': f'Bearer {ha_token}',
-            'Content-Type': 'application/json',
-        }
-        
-        response = requests.post(
-            f'{ha_url}/api/services/select/select_option',
-            headers=headers,
-            json={
-                'entity_id': select_entity,
-                'option': schedule
-            },
-            timeout=10
-        )
-        response.raise_for_status()
+        await ha_client.call_service('select', 'select_option', {
+            'entity_id': select_entity(),
+            'option': schedule
+        })
+        ha_poller.wake()
         
         return JsonResponse({'success': True, 'schedule': schedule})
     except (json.JSONDecodeError, ValueError, TypeError) as e:
         return JsonResponse({'error': f'Dati non validi: {str(e)}'}, status=400)
-    except requests.exceptions.RequestException as e:
+    except HomeAssistantUnavailable:
+        return JsonResponse({'error': HA_UNAVAILABLE}, status=503)
+    except httpx.HTTPError as e:
         return JsonResponse({'error': f'Errore connessione HA: {str(e)}'}, status=500)
 
 
@@ -940,10 +903,10 @@ def ownership_periods_view(request):
 
     def period_to_segment_in_range(period, range_start, range_end):
         range_days = (range_end - range_start).days + 1
-        overlap_start = max(period.start_date, range_start)
-        overlap_end = min(period.end_date, range_end)
-        if overlap_start > overlap_end:
+        overlap = clip_range(period.start_date, period.end_date, range_start, range_end)
+        if overlap is None:
             return None
+        overlap_start, overlap_end = overlap
         left = (overlap_start - range_start).days / range_days * 100
         width = ((overlap_end - overlap_start).days + 1) / range_days * 100
         return {
@@ -970,10 +933,18 @@ def ownership_periods_view(request):
         },
     ]
 
+    # Days covered per family, for the half-year headers
+    coverage = coverage_by_key((p.family_group, p.start_date, p.end_date) for p in all_periods)
+
     for half in timeline_halves:
         range_start = half['start']
         range_end = half['end']
         range_days = (range_end - range_start).days + 1
+        half['days_by_family'] = [
+            (group, coverage[group].days_between(range_start, range_end))
+            for group in (user_group, other_group)
+            if group in coverage
+        ]
         segments = []
         for p in all_periods:
             seg = period_to_segment_in_range(p, range_start, range_end)
@@ -1003,6 +974,8 @@ def ownership_periods_view(request):
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=ownership_periods_etag)
 def ownership_periods_api(request):
     """API endpoint returning ownership periods as calendar background events"""
     periods = OwnershipPeriod.objects.all()
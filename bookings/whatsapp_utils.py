@@ -1,11 +1,36 @@
 import requests
+import threading
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
 from django.conf import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
-def send_whatsapp_notification(phone_number, message_text, api_key=None):
+# Sessione HTTP condivisa: le connessioni keep-alive verso CallMeBot vengono
+# riutilizzate tra un invio e l'altro invece di rifare TCP+TLS ogni volta.
+_session = None
+_session_lock = threading.Lock()
+
+
+def _max_workers():
+    return getattr(settings, 'WHATSAPP_MAX_WORKERS', 4)
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_max_workers())
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def send_whatsapp_notification(phone_number, message_text, api_key=None, timeout=None):
     """
     Invia una notifica WhatsApp tramite CallMeBot.
     
@@ -13,6 +38,7 @@ def send_whatsapp_notification(phone_number, message_text, api_key=None):
         phone_number (str): Numero formato internazionale (es. +393331234567)
         message_text (str): Il testo del messaggio (NO HTML).
         api_key (str): La chiave API personale dell'utente per CallMeBot.
+        timeout (float): Timeout della singola richiesta (default WHATSAPP_TIMEOUT).
     """
     
     if not api_key:
@@ -25,8 +51,10 @@ def send_whatsapp_notification(phone_number, message_text, api_key=None):
     url = f"https://api.callmebot.com/whatsapp.php?phone={phone_number}&text={encoded_message}&apikey={api_key}"
     
     try:
-        # Timeout breve per non bloccare il thread Django se CallMeBot è lento
-        response = requests.get(url, timeout=10)
+        # Timeout breve per non bloccare il worker se CallMeBot è lento
+        if timeout is None:
+            timeout = getattr(settings, 'WHATSAPP_TIMEOUT', 10)
+        response = get_session().get(url, timeout=timeout)
         
         if response.status_code == 200:
             logger.info(f"WhatsApp inviato a {phone_number}")
@@ -39,6 +67,44 @@ def send_whatsapp_notification(phone_number, message_text, api_key=None):
         logger.error(f"Eccezione invio WhatsApp: {str(e)}")
         return False
 
+def send_whatsapp_batch(recipients, message_text, timeout=None, deadline=None):
+    """
+    Invia lo stesso messaggio a più destinatari in parallelo.
+
+    Il tempo totale è quello della richiesta più lenta (al massimo `deadline`
+    secondi, default WHATSAPP_DEADLINE), non la somma delle richieste.
+
+    Args:
+        recipients: lista di (phone_number, api_key)
+    Returns:
+        dict {phone_number: True/False}; False anche per chi non ha risposto entro la deadline.
+    """
+    if not recipients:
+        return {}
+    if deadline is None:
+        deadline = getattr(settings, 'WHATSAPP_DEADLINE', 15)
+
+    executor = ThreadPoolExecutor(max_workers=min(_max_workers(), len(recipients)))
+    futures = {
+        executor.submit(send_whatsapp_notification, phone, message_text, api_key, timeout): phone
+        for phone, api_key in recipients
+    }
+    done, not_done = wait(futures, timeout=deadline)
+    # Non aspettare le richieste ancora in corso: terminano da sole al loro timeout
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = {}
+    for future, phone in futures.items():
+        if future in done and not future.exception():
+            results[phone] = future.result()
+        else:
+            if future in not_done:
+                logger.error(f"WhatsApp a {phone} non inviato entro {deadline}s")
+            else:
+                logger.error(f"Eccezione invio WhatsApp a {phone}: {future.exception()}")
+            results[phone] = False
+    return results
+
 def format_message_for_whatsapp(subject, context_data):
     """
     Format generic notification data into WhatsApp text.
@@ -18,8 +18,21 @@ service cron start
 echo "Running database migrations..."
 gosu appuser python manage.py migrate --noinput
 
+echo "Checking SQLite profile..."
+gosu appuser python manage.py check_sqlite_profile || echo "WARNING: SQLite profile not fully active"
+
+echo "Backfilling approval dates..."
+gosu appuser python manage.py backfill_approved_at
+
+echo "Rebuilding statistics aggregates..."
+gosu appuser python manage.py rebuild_statistics
+
 echo "Collecting static files..."
 gosu appuser python manage.py collectstatic --noinput
 
+echo "Starting notification worker..."
+# Long-running loop: keep its connection (and PRAGMAs) across polls
+gosu appuser env DB_CONN_MAX_AGE=600 python manage.py process_notifications >> /var/log/notifications.log 2>&1 &
+
 echo "Starting application..."
 exec gosu appuser "$@"
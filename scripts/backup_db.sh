@@ -19,8 +19,9 @@ backup_file="${BACKUP_DIR}/db_${timestamp}.sqlite3"
 if command -v sqlite3 >/dev/null 2>&1; then
   sqlite3 "${DB_PATH}" ".backup '${backup_file}'"
 else
-  # Fallback (less safe under write load, but DB is small)
-  cp "${DB_PATH}" "${backup_file}"
+  # Online backup API: consistent copy including the pages still in the WAL file
+  python3 -c 'import sqlite3, sys; src = sqlite3.connect(sys.argv[1], timeout=30); dst = sqlite3.connect(sys.argv[2]); src.backup(dst); dst.close(); src.close()' \
+    "${DB_PATH}" "${backup_file}"
 fi
 
 # Retention (delete older than N days)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Start WEB_WORKERS Daphne processes sharing one listening socket.
+
+Daphne has no worker option: the socket is bound here and handed to every
+process with --fd, so the kernel spreads the connections among them. The
+live groups (chat, notifications, calendar, thermostat) reach every worker
+through the SQLite channel layer. With one worker (the default) Daphne is
+simply exec'd.
+
+If a worker exits the others are stopped too and the container restarts.
+"""
+import os
+import signal
+import socket
+import subprocess
+import sys
+
+APPLICATION = 'PrenoPinzo.asgi:application'
+
+
+def main():
+    host = os.environ.get('WEB_BIND', '0.0.0.0')
+    port = int(os.environ.get('WEB_PORT', '8000'))
+    workers = max(1, int(os.environ.get('WEB_WORKERS', '1')))
+
+    if workers == 1:
+        os.execvp('daphne', ['daphne', '-b', host, '-p', str(port), APPLICATION])
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    fd = sock.fileno()
+
+    processes = [
+        subprocess.Popen(['daphne', '--fd', str(fd), APPLICATION], pass_fds=[fd])
+        for _ in range(workers)
+    ]
+    print(f'[serve] {workers} Daphne workers on {host}:{port}', flush=True)
+
+    def stop(signum, frame):
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    pid, status = os.wait()
+    stop(None, None)
+    for process in processes:
+        process.wait()
+    sys.exit(os.waitstatus_to_exitcode(status))
+
+
+if __name__ == '__main__':
+    main()